@@ -1,2 +1,3 @@
 # Requires Python 3.5+
-PYTHONPATH=$(pwd)/src python3 src/blackjack/blackjackgame_unit_tests.py
\ No newline at end of file
+PYTHONPATH=$(pwd)/src python3 src/blackjack/blackjackgame_unit_tests.py && \
+PYTHONPATH=$(pwd)/src python3 src/simulation/simulation_unit_tests.py
\ No newline at end of file
@@ -0,0 +1,279 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from blackjack.blackjackgame import BlackjackGame
+from blackjack.loadtest import bot_answers
+from checkpoint import write_atomic
+from gamepieces.card import Card
+from gamepieces.deck import Deck
+from gamepieces.shoe import Shoe
+from gamepieces.shoe_library import ShoeLibrary, generate
+from inputmanager import ScriptedInputManager
+from simulation.engine import Table
+from simulation.rules import RuleTable, get_rules
+from simulation.strategies import get_strategy
+
+DEFAULT_HISTORY = ".bench_history.json"
+DECK_COUNTS = (1, 2, 4, 6, 8)
+
+
+def _sample_hands(num_hands: int = 100) -> List[List[Card]]:
+    rng = random.Random(0)
+    return [[Card(rng.randint(1, 13), rng.randint(0, 3))
+             for _ in range(rng.randint(2, 4))] for _ in range(num_hands)]
+
+
+def bench_calc_hand_value():
+    game = BlackjackGame(1, 1, 2, 500, 500)
+    hands = _sample_hands()
+
+    def run():
+        for hand in hands:
+            game._calc_hand_value(hand)
+    return (run, len(hands))
+
+
+def bench_is_double_hand():
+    game = BlackjackGame(1, 1, 2, 500, 500)
+    hands = _sample_hands()
+
+    def run():
+        for hand in hands:
+            game._is_double_hand(hand)
+    return (run, len(hands))
+
+
+def bench_deck_init():
+    return (Deck, 1)
+
+
+def bench_shoe_init(num_decks):
+    return (lambda: Shoe(num_decks, rng=random.Random(0)), 1)
+
+
+def bench_shoe_shuffle(num_decks):
+    shoe = Shoe(num_decks, rng=random.Random(0))
+    return (shoe.shuffle, 1)
+
+
+def bench_shoe_deal(num_decks):
+    shoe = Shoe(num_decks, rng=random.Random(0))
+    # built once, so the timing is dealing rather than making cards
+    cards = shoe._cards
+    num_cards = len(cards)
+
+    def run():
+        shoe._cards = list(cards)
+        for _ in range(num_cards):
+            shoe.deal()
+    return (run, num_cards)
+
+
+def _scripted_game(num_decks: int) -> BlackjackGame:
+    """Game of one seated player, answered by the load test's bot."""
+    i_manager = ScriptedInputManager(
+        responder=bot_answers(random.Random(0), 10 ** 12, junk_rate=0))
+    game = BlackjackGame(1, num_decks, 2, 500, 10 ** 9, i_manager=i_manager,
+                         seed=0)
+    game.human_players[0].name = "bot"
+    game._init_betting()
+    return game
+
+
+def bench_game_round(num_decks):
+    return (_scripted_game(num_decks)._play_round, 1)
+
+
+def bench_game_full_shoe(num_decks):
+    game = _scripted_game(num_decks)
+
+    def run():
+        # the game replaces its shoe once it runs out
+        shoe = game.shoe
+        while game.shoe is shoe:
+            game._play_round()
+    return (run, 1)
+
+
+def bench_table_round(num_decks):
+    table = Table(1, num_decks, 2, 500, 10 ** 9, get_strategy("basic"),
+                  seed=0)
+    return (table.play_round, 1)
+
+
+def bench_rules_round(num_decks):
+    table = RuleTable(1, num_decks, 2, 500, 10 ** 9, get_strategy("basic"),
+                      seed=0, rules=get_rules("vegas_h17"))
+    return (table.play_round, 1)
+
+
+def bench_table_full_shoe(num_decks):
+    def run():
+        table = Table(1, num_decks, 2, 500, 10 ** 9, get_strategy("basic"),
+                      seed=0)
+        while table.stats.reshuffles == 0:
+            table.play_round()
+    return (run, 1)
+
+
+def _library(num_decks: int, num_rows: int) -> ShoeLibrary:
+    """Library in a temporary file, which stays mapped once removed."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "shoes.bin")
+        generate(path, num_decks, num_rows)
+        return ShoeLibrary(path)
+
+
+def bench_library_deal(num_decks):
+    library = _library(num_decks, 1)
+
+    def run():
+        shoe = library.shoe(0)
+        for _ in range(library.row_size):
+            shoe.deal()
+    return (run, library.row_size)
+
+
+def bench_library_full_shoe(num_decks):
+    library = _library(num_decks, 1)
+
+    def run():
+        table = Table(1, num_decks, 2, 500, 10 ** 9, get_strategy("basic"),
+                      shoes=library.shoes())
+        while table.stats.reshuffles == 0:
+            table.play_round()
+    return (run, 1)
+
+
+def benchmarks() -> List[Tuple[str, Callable]]:
+    """(name, factory) pairs, factories return (callable, ops per call)."""
+    cases = [("calc_hand_value", bench_calc_hand_value),
+             ("is_double_hand", bench_is_double_hand),
+             ("deck_init", bench_deck_init)]
+    for (name, bench) in (("shoe_init", bench_shoe_init),
+                          ("shoe_shuffle", bench_shoe_shuffle),
+                          ("shoe_deal", bench_shoe_deal),
+                          ("game_round", bench_game_round),
+                          ("game_full_shoe", bench_game_full_shoe),
+                          ("table_round", bench_table_round),
+                          ("rules_round", bench_rules_round),
+                          ("table_full_shoe", bench_table_full_shoe),
+                          ("library_deal", bench_library_deal),
+                          ("library_full_shoe", bench_library_full_shoe)):
+        for num_decks in DECK_COUNTS:
+            cases.append((f"{name}[nd={num_decks}]",
+                          lambda bench=bench, num_decks=num_decks:
+                          bench(num_decks)))
+    return cases
+
+
+def time_benchmark(factory: Callable, repeat: int = 5,
+                   min_time: float = 0.2) -> float:
+    """Best seconds per op over repeat runs of at least min_time each."""
+    (func, ops) = factory()
+    timer = timeit.Timer(func)
+    (number, _) = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat, number)) / number / ops
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_history(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def run(path: str, pattern: str = "", repeat: int = 5) -> Dict:
+    """Times every benchmark matching pattern and appends to the history."""
+    results = {}
+    with open(os.devnull, "w") as sink:
+        for (name, factory) in benchmarks():
+            if pattern in name:
+                # the game prints as it plays
+                with contextlib.redirect_stdout(sink):
+                    results[name] = time_benchmark(factory, repeat)
+                print(f"{name:24} {results[name] * 1e6:12.3f} us/op")
+
+    entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "commit": _git_commit(),
+             "python": platform.python_version(),
+             "results": results}
+    history = load_history(path)
+    history.append(entry)
+    write_atomic(path, json.dumps(history, indent=1).encode("utf-8"))
+    return entry
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """Names of benchmarks that got slower by more than threshold."""
+    regressions = []
+    for (name, seconds) in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:24} {before * 1e6:12.3f} -> {seconds * 1e6:12.3f} "
+              f"us/op {change * 100:+7.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmark the game's hot paths")
+    parser.add_argument("--history", default=DEFAULT_HISTORY,
+                        help="JSON file of past benchmark runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run and record benchmarks")
+    run_parser.add_argument("-k", "--pattern", default="",
+                            help="Only run benchmarks containing this")
+    run_parser.add_argument("--repeat", type=int, default=5,
+                            help="Timing repeats, best is kept")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two recorded runs")
+    compare_parser.add_argument("--baseline", type=int, default=-2,
+                                help="History index of the baseline run")
+    compare_parser.add_argument("--current", type=int, default=-1,
+                                help="History index of the run to check")
+    compare_parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                                help="Slowdown fraction flagged as regression")
+
+    args = vars(parser.parse_args())
+    if args["command"] == "run":
+        run(args["history"], args["pattern"], max(1, args["repeat"]))
+    else:
+        history = load_history(args["history"])
+        if len(history) < 2:
+            print("Need at least two recorded runs to compare")
+            exit(1)
+        (baseline, current) = (history[args["baseline"]],
+                               history[args["current"]])
+        print(f"baseline {baseline['commit']} ({baseline['time']}) vs "
+              f"current {current['commit']} ({current['time']})")
+        regressions = compare(baseline, current, args["threshold"])
+        exit(1 if regressions else 0)
@@ -1,9 +1,12 @@
 import argparse
+import os
 import random
 import time
 
 from typing import List, Set
 
+import metrics
+from checkpoint import KIND_GAME, Checkpointer, Reader, Writer, read_file
 from game import Game
 from players.human_player import HumanPlayer
 from players.dealer import Dealer
@@ -17,9 +20,11 @@ class BlackjackGame(Game):
     """Class for Blackjack game."""
 
     def __init__(self, num_players: int, num_decks: int, min_bet: int,
-                 max_bet: int, starting_chips: int) -> None:
+                 max_bet: int, starting_chips: int, i_manager=None,
+                 seed=None) -> None:
+        """Passing a seed makes shuffles repeatable instead of time seeded."""
         super().__init__([HumanPlayer(starting_chips)
-                          for _ in range(num_players)])
+                          for _ in range(num_players)], i_manager)
 
         # alias for blackjack
         self.human_players = self.players
@@ -36,6 +41,10 @@ class BlackjackGame(Game):
 
         self.round = 1
 
+        self.seed = seed
+        if seed is not None:
+            random.seed(seed)
+
         # set up deck
         self.shoe = Shoe(num_decks)
 
@@ -45,6 +54,61 @@ class BlackjackGame(Game):
 
         self.dealer = Dealer()
 
+        # saves game to a file every few seconds, and on quitting
+        self.checkpointer = None
+        # state at the start of the current round, or once its bets are
+        # placed, kept for quitting mid round
+        self._round_checkpoint = None
+        self.resumed = False
+        # set once every player is out, when there is nothing to resume
+        self.finished = False
+
+    def to_checkpoint(self) -> bytes:
+        """
+        Full game state before a round's cards are dealt: shoe, RNG, chips,
+        main bets and round.
+        """
+        writer = Writer(KIND_GAME)
+        for value in (self.shoe.num_decks, self.min_bet, self.max_bet,
+                      self.starting_chips, self.round):
+            writer.int64(value)
+        writer.int64(self.seed is not None)
+        writer.int64(self.seed or 0)
+        writer.rng_state(random.getstate())
+        writer.blob(self.shoe.to_codes())
+        writer.int64(len(self.human_players))
+        for player in self.human_players:
+            writer.text(player.name or "")
+            writer.number(player.chips)
+            writer.number(self.player_main_bets.get(player, 0))
+        return writer.getvalue()
+
+    @staticmethod
+    def from_checkpoint(data: bytes, i_manager=None) -> "BlackjackGame":
+        """Raises CheckpointError if data is not a game checkpoint."""
+        reader = Reader(data, KIND_GAME)
+        (num_decks, min_bet, max_bet, starting_chips, round_num) = [
+            reader.int64() for _ in range(5)]
+        has_seed = reader.int64()
+        seed = reader.int64()
+        rng_state = reader.rng_state()
+        codes = reader.blob()
+        num_players = reader.int64()
+
+        game = BlackjackGame(num_players, num_decks, min_bet, max_bet,
+                             starting_chips, i_manager,
+                             seed if has_seed else None)
+        random.setstate(rng_state)
+        game.shoe = Shoe.from_codes(num_decks, codes)
+        game.round = round_num
+        game._init_betting()
+        for player in game.human_players:
+            player.name = reader.text()
+            player.chips = reader.number()
+            game.player_main_bets[player] = reader.number()
+        game.resumed = True
+        return game
+
     def _print_players(self, bet: bool = False, hand: bool = False):
         title = "=== PLAYER SUMMARY ==="
         print(title, end="")
@@ -121,7 +185,9 @@ class BlackjackGame(Game):
                 del self.bj_players[player]
             del self.human_players[player_index]
 
+            metrics.incr(metrics.BUSTED_PLAYERS)
             if len(self.human_players) < 1:
+                self.finished = True
                 self.quit_game("No players remaining...Quitting game")
             return False
         return True
@@ -293,6 +359,8 @@ class BlackjackGame(Game):
                 return True
 
     def _handle_double(self, player):
+        # the extra stake comes out of the player's chips, as for a split
+        player.chips -= self.player_main_bets[player]
         self.player_main_bets[player] *= 2
         print(
             f"=== Player \"{player.name}\" has doubled their bet to {self.player_main_bets[player]} ===")
@@ -322,7 +390,7 @@ class BlackjackGame(Game):
 
             print("=== Current hand value: " +
                   "/".join([str(i) for i in list(hand_vals)]) + " ===")
-            choice = int(self.i_manager.get_input(
+            choice = int(self._get_decision(
                 "Do you wish to:\n1.) hit\n2.) stand\n-> ",
                 is_num_within_bounds(1, 2),
                 "Please enter 1 or 2",
@@ -342,6 +410,14 @@ class BlackjackGame(Game):
                 break
         return player_hand
 
+    def _get_decision(self, *args, **kwargs):
+        """get_input for play decisions, timed for metrics."""
+        start = time.perf_counter_ns()
+        choice = self.i_manager.get_input(*args, **kwargs)
+        metrics.incr(metrics.DECISIONS)
+        metrics.incr(metrics.DECISION_NS, time.perf_counter_ns() - start)
+        return choice
+
     def _player_actions(self) -> bool:
         "Returns True if dealer had blackjack"
 
@@ -368,24 +444,29 @@ class BlackjackGame(Game):
                 self.bj_players[player] = True
                 continue
             else:
-                split_option = self._is_split_hand(player.hand)
-                double_option = self._is_double_hand(player.hand)
+                # both options need chips to match the original bet
+                can_match_bet = player.chips >= self.player_main_bets[player]
+                split_option = can_match_bet and self._is_split_hand(
+                    player.hand)
+                double_option = can_match_bet and self._is_double_hand(
+                    player.hand)
 
                 if split_option and double_option:
-                    # can choose to either split or choose
+                    # can choose to split, double or play on normally
                     print(
                         f"=== Player \"{player.name}\" has additional options! ===")
-                    player_choice = int(self.i_manager.get_input(
-                        "Do you wish to:\n1.) split\n2.) double\n-> ",
-                        is_num_within_bounds(1, 2),
-                        "Please enter 1 or 2",
+                    player_choice = int(self._get_decision(
+                        "Do you wish to:\n1.) split\n2.) double\n"
+                        "3.) neither\n-> ",
+                        is_num_within_bounds(1, 3),
+                        "Please enter 1, 2 or 3",
                         quit_callback=lambda:
                         self.quit_game("Quitting game...")))
 
                     if player_choice == 1:
                         if self._handle_split(player):
                             continue
-                    else:
+                    elif player_choice == 2:
                         self._handle_double(player)
                         continue
                 elif split_option or double_option:
@@ -393,7 +474,7 @@ class BlackjackGame(Game):
                         f"=== Player \"{player.name}\" has additional options! ===")
                     if split_option:
                         # only choice to split
-                        player_choice = self.i_manager.get_input(
+                        player_choice = self._get_decision(
                             "Do you wish to split (y/n): ",
                             y_or_n,
                             "Please enter \"y\" or \"n\"",
@@ -405,7 +486,7 @@ class BlackjackGame(Game):
                                 continue
                     else:
                         # only choice to double
-                        player_choice = self.i_manager.get_input(
+                        player_choice = self._get_decision(
                             "Do you wish to double (y/n): ",
                             y_or_n,
                             "Please enter \"y\" or \"n\"",
@@ -575,6 +656,12 @@ class BlackjackGame(Game):
                 f"=== Player \"{player.name}\" refunded their bet of ${original_bet_amount} and won an additional ${original_bet_amount * 1.5} ===")
 
         player.chips += original_bet_amount * player_payback_multiple
+        metrics.incr(metrics.HANDS)
+        metrics.incr(metrics.WAGERED, original_bet_amount)
+        metrics.incr(metrics.HOUSE_NET, original_bet_amount *
+                     (1 - player_payback_multiple))
+        if not dealer_blackjack and len(player_hand_vals) == 0:
+            metrics.incr(metrics.HAND_BUSTS)
         print()
 
     def _reset_round(self):
@@ -586,11 +673,16 @@ class BlackjackGame(Game):
         self._init_betting()
         self.round += 1
 
+    def _seed_rng(self):
+        # seed random num generator, unless game was given a fixed seed
+        if self.seed is None:
+            random.seed(time.time())
+
     def _reset_shoe(self):
-        # seed random num generator
-        random.seed(time.time())
+        self._seed_rng()
 
         print("=== Resetting shoe and reshuffling ===")
+        metrics.incr(metrics.RESHUFFLES)
         num_decks = self.shoe.num_decks
         self.shoe = Shoe(num_decks)
         self.shoe.shuffle()
@@ -605,8 +697,7 @@ class BlackjackGame(Game):
         # clear screen
         self.i_manager.clear_screen()
 
-        # seed random num generator
-        random.seed(time.time())
+        self._seed_rng()
 
         # select player names
         self.player_main_bets = {}
@@ -630,38 +721,78 @@ class BlackjackGame(Game):
 
     def play(self) -> None:
         """Main game loop for Blackjack."""
+        try:
+            self._play()
+        except SystemExit:
+            if self.checkpointer and self.finished:
+                self.checkpointer.remove()
+            elif self.checkpointer and self._round_checkpoint:
+                # quit from any prompt, resuming replays the interrupted round
+                # with any bets already placed, dealt from a reshuffled shoe
+                self.checkpointer.save(self._round_checkpoint)
+                print(f"=== Game saved to {self.checkpointer.path} ===")
+            raise
 
-        self.game_setup()
+    def _play(self) -> None:
+        # a round resumed after its bets were placed is not bet again
+        bets_placed = False
+        if self.resumed:
+            print(f"=== Resuming game at round {self.round} ===")
+            # cards seen before quitting must not come again in the same order
+            self._seed_rng()
+            self.shoe.shuffle()
+            bets_placed = any(self.player_main_bets.values())
+        else:
+            self.game_setup()
 
         # main_game_loop
         while True:
+            self._play_round(bets_placed)
+            bets_placed = False
+
+    def _play_round(self, bets_placed: bool = False) -> None:
+        """
+        Plays one round, from betting to settling. bets_placed skips the
+        betting, for a round resumed after its bets were placed.
+        """
+        if not bets_placed:
+            if self.checkpointer:
+                self._round_checkpoint = self.to_checkpoint()
+                if self.checkpointer.due():
+                    self.checkpointer.save(self._round_checkpoint)
+
             # Print current game state
             self._print_game_state()
 
             # also checks if players are still in the game
             self._collect_bets()
 
-            self.i_manager.clear_screen()
-            self._print_bets()
-            self.i_manager.enter_to_cont()
+        if self.checkpointer:
+            # quitting once the cards are out keeps the bets down
+            self._round_checkpoint = self.to_checkpoint()
 
-            try:
-                self._deal_hands()
+        self.i_manager.clear_screen()
+        self._print_bets()
+        self.i_manager.enter_to_cont()
 
-                dealer_blackjack = self._player_actions()
-                if not dealer_blackjack:
-                    self._dealer_actions()
-            except NoMoreCardsError:
-                print("=== Run out of cards ===")
-                print("=== Refunding bets ===")
-                self._refund_bets()
-                self._reset_shoe()
-                print("=== Starting new round ===")
-                self._reset_round()
-                continue
+        try:
+            self._deal_hands()
 
-            self._settle_payments(dealer_blackjack)
+            dealer_blackjack = self._player_actions()
+            if not dealer_blackjack:
+                self._dealer_actions()
+        except NoMoreCardsError:
+            print("=== Run out of cards ===")
+            print("=== Refunding bets ===")
+            self._refund_bets()
+            self._reset_shoe()
+            print("=== Starting new round ===")
             self._reset_round()
+            return
+
+        self._settle_payments(dealer_blackjack)
+        metrics.incr(metrics.ROUNDS)
+        self._reset_round()
 
     def quit_game(self, quit_message):
         print(quit_message)
@@ -681,6 +812,12 @@ if __name__ == "__main__":
                         help="Maximum bet amount")
     parser.add_argument("-start", "--starting_chips", type=int, default=500,
                         help="Starting chips amount")
+    parser.add_argument("--metrics", default=None,
+                        help="Name of shared metrics block to update")
+    parser.add_argument("--checkpoint", default=None,
+                        help="File to save the game to while playing")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume the game saved in the checkpoint file")
 
     args = vars(parser.parse_args())
     print(args)
@@ -690,5 +827,13 @@ if __name__ == "__main__":
     max_bet = max(1, args["max_bet"])
     sc = max(1, args["starting_chips"])
 
-    bj_game = BlackjackGame(np, nd, min_bet, max_bet, sc)
+    if args["metrics"]:
+        metrics.enable(args["metrics"])
+
+    if args["resume"] and args["checkpoint"] and os.path.exists(args["checkpoint"]):
+        bj_game = BlackjackGame.from_checkpoint(read_file(args["checkpoint"]))
+    else:
+        bj_game = BlackjackGame(np, nd, min_bet, max_bet, sc)
+    if args["checkpoint"]:
+        bj_game.checkpointer = Checkpointer(args["checkpoint"])
     bj_game.play()
@@ -1,6 +1,16 @@
+import contextlib
+import io
+import os
+import tempfile
 import unittest
 from blackjack.blackjackgame import BlackjackGame
+from blackjack.differential import (ENGINES, Scenario, check_engine,
+                                    mismatch, run_table)
+from checkpoint import Checkpointer, read_file
 from gamepieces.card import Card
+from inputmanager import ScriptedInputManager
+from renderer import Renderer, hand_str
+from simulation.strategies import HIT, STAND
 
 
 class TestStringMethods(unittest.TestCase):
@@ -45,6 +55,144 @@ class TestStringMethods(unittest.TestCase):
         self.assertFalse(bj_game._is_double_hand([Card(3, 2), Card(9, 2)]))
         self.assertFalse(bj_game._is_double_hand([Card(2, 2), Card(5, 2)]))
 
+    def test_scripted_session(self):
+        # invalid bet is re-prompted, then the script ends at the next bet
+        i_manager = ScriptedInputManager(["alice", "abc", "10"] + ["2"] * 10)
+        bj_game = BlackjackGame(1, 4, 2, 500, 500, i_manager=i_manager,
+                                seed=1)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            with self.assertRaises(SystemExit):
+                bj_game.play()
+        self.assertEqual(bj_game.human_players[0].name, "alice")
+        self.assertIn("Please enter a bet between", output.getvalue())
+        self.assertGreaterEqual(bj_game.round, 2)
+        # without a checkpointer, rounds take no checkpoints
+        self.assertIsNone(bj_game._round_checkpoint)
+
+    def test_scripted_answers_and_responder(self):
+        def read(i_manager, prompt):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return i_manager.get_input(prompt, None, "")
+
+        # a plain generator of answers keeps its first answer
+        plain = ScriptedInputManager(a for a in ["first", "second"])
+        self.assertEqual([read(plain, "a"), read(plain, "b"),
+                          read(plain, "c")], ["first", "second", None])
+
+        def echo():
+            prompt = yield
+            while True:
+                prompt = yield prompt.upper()
+
+        responder = ScriptedInputManager(responder=echo())
+        self.assertEqual(read(responder, "bet? "), "BET? ")
+        self.assertEqual(responder.answers_used, 1)
+
+    def test_checkpoint_round_trip(self):
+        bj_game = BlackjackGame(2, 2, 5, 100, 300, seed=4)
+        for (player, name) in zip(bj_game.human_players, ["a", "b"]):
+            player.name = name
+        bj_game.human_players[1].chips = 212.5
+        bj_game.round = 7
+        bj_game.shoe.deal()
+
+        restored = BlackjackGame.from_checkpoint(bj_game.to_checkpoint())
+        self.assertEqual([(p.name, p.chips) for p in restored.human_players],
+                         [("a", 300), ("b", 212.5)])
+        self.assertEqual(restored.round, 7)
+        self.assertEqual((restored.min_bet, restored.max_bet), (5, 100))
+        self.assertEqual(restored.shoe.to_codes(), bj_game.shoe.to_codes())
+        self.assertTrue(restored.resumed)
+
+    def test_checkpoint_kept_only_while_game_can_resume(self):
+        def answers(count):
+            prompt = yield
+            for _ in range(count):
+                prompt = yield "n" if "(y/n)" in prompt else "2"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.ckpt")
+            # the only player's two chips are lost, so the game is over
+            for (count, finished) in ((200, True), (2, False)):
+                bj_game = BlackjackGame(
+                    1, 1, 2, 500, 2, seed=0,
+                    i_manager=ScriptedInputManager(responder=answers(count)))
+                bj_game.checkpointer = Checkpointer(path, interval=0)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    with self.assertRaises(SystemExit):
+                        bj_game.play()
+                self.assertEqual(bj_game.finished, finished)
+                self.assertEqual(os.path.exists(path), not finished)
+
+    def test_quit_after_betting_keeps_bet_for_new_cards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.ckpt")
+            # the script ends at the first play decision
+            bj_game = BlackjackGame(
+                1, 1, 2, 500, 500, seed=2,
+                i_manager=ScriptedInputManager(["alice", "10"]))
+            bj_game.checkpointer = Checkpointer(path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    bj_game.play()
+            restored = BlackjackGame.from_checkpoint(read_file(path),
+                                                     ScriptedInputManager())
+            player = restored.human_players[0]
+            self.assertEqual((player.chips, restored.player_main_bets[player]),
+                             (490, 10))
+
+            # resuming plays the bet down on a reshuffled shoe
+            restored.checkpointer = Checkpointer(path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    restored.play()
+            self.assertEqual(restored.round, bj_game.round)
+            self.assertEqual(player.chips, 490)
+            self.assertNotEqual(
+                [card.to_code() for card in player.hand],
+                [card.to_code() for card in bj_game.human_players[0].hand])
+
+    def test_renderer_redraws_changed_lines(self):
+        output = io.StringIO()
+        renderer = Renderer(output)
+        renderer.render(["a", "b", "c"])
+        self.assertIn("\033[2J", output.getvalue())
+
+        output.seek(0)
+        output.truncate()
+        renderer.render(["a", "x"])
+        frame = output.getvalue()
+        self.assertNotIn("a", frame)
+        self.assertIn("\033[2;1Hx\033[K", frame)
+        self.assertIn("\033[3;1H\033[K", frame)
+        self.assertEqual(hand_str([Card(1, 3), Card(10, 2)]), "A♠ 10♥")
+
+
+class TestDifferential(unittest.TestCase):
+    def test_engines_match_reference(self):
+        for (name, engine) in ENGINES.items():
+            self.assertIsNone(check_engine(engine, 300, seed=5), name)
+
+    def test_pair_of_fives_can_hit(self):
+        # 5-5 may split or double, and hitting it instead must still work
+        scenario = Scenario([16, 17, 32, 24, 4, 40, 44], [5], [0],
+                            [HIT, STAND])
+        for (name, engine) in ENGINES.items():
+            self.assertIsNone(mismatch(scenario, engine), name)
+        self.assertEqual(run_table(scenario)["values"], [12])
+
+    def test_mismatch_is_shrunk(self):
+        def no_blackjack_bonus(scenario):
+            outcome = run_table(scenario)
+            if not outcome["exhausted"] and 21 in outcome["values"]:
+                outcome["chips"] = [0] * len(outcome["chips"])
+            return outcome
+
+        failing = check_engine(no_blackjack_bonus, 300, seed=5)
+        self.assertIsNotNone(failing)
+        self.assertEqual(len(failing.bets), 1)
+        self.assertLessEqual(len(failing.deal_order), 5)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import io
+import random
+from typing import Callable, Dict, List, Optional
+
+from blackjack.blackjackgame import BlackjackGame
+from gamepieces.deck import NoMoreCardsError
+from gamepieces.shoe import Shoe
+from inputmanager import ScriptedInputManager
+from simulation.engine import Table, hand_value
+from simulation.rules import RuleSet, RuleTable
+from simulation.strategies import HIT, STAND, DOUBLE, SPLIT, Strategy
+
+ACTION_NAMES = {HIT: "hit", STAND: "stand", DOUBLE: "double", SPLIT: "split"}
+
+
+class Scenario:
+    """
+    One round at a single-deck table: the cards in the order they are dealt,
+    each player's bet and insurance, and the play decisions in order.
+
+    Decisions are shared by all players in turn order. A split or double
+    that is not offered counts as a stand, and running out of decisions
+    stands.
+    """
+
+    def __init__(self, deal_order: List[int], bets: List[int],
+                 insurance: List[int], decisions: List[int],
+                 starting_chips: int = 100, min_bet: int = 1,
+                 max_bet: int = 50) -> None:
+        self.deal_order = list(deal_order)
+        self.bets = list(bets)
+        self.insurance = list(insurance)
+        self.decisions = list(decisions)
+        self.starting_chips = starting_chips
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+
+    def copy(self, **changes) -> "Scenario":
+        values = dict(vars(self))
+        values.update(changes)
+        return Scenario(**values)
+
+    def shoe(self, rng=None) -> Shoe:
+        # shoes deal from the end of their list
+        return Shoe.from_codes(1, bytes(reversed(self.deal_order)), rng=rng)
+
+    def __repr__(self):
+        decisions = [ACTION_NAMES[d] for d in self.decisions]
+        return (f"Scenario(deal_order={self.deal_order}, bets={self.bets}, "
+                f"insurance={self.insurance}, decisions={decisions}, "
+                f"starting_chips={self.starting_chips})")
+
+
+def _outcome(chips, hands, dealer_hand, cards_left, exhausted) -> Dict:
+    """Comparable summary of a round: chips, hands, values and shoe left."""
+    if exhausted:
+        return {"chips": list(chips), "exhausted": True}
+    return {
+        "chips": list(chips),
+        "exhausted": False,
+        "hands": [[card.to_code() for card in hand] for hand in hands],
+        "values": [hand_value(hand)[0] for hand in hands],
+        "dealer_hand": [card.to_code() for card in dealer_hand],
+        "cards_left": cards_left,
+    }
+
+
+def _reference_answers(scenario: Scenario):
+    """Answers BlackjackGame's prompts to play out the scenario."""
+    decisions = list(scenario.decisions)
+    # answer owed to the next hit/stand prompt after declining an option
+    pending = None
+    player = 0
+    prompt = yield
+    while True:
+        if prompt.startswith("Enter bet for player"):
+            player = int(prompt.split('"')[1][1:])
+            answer = str(scenario.bets[player])
+        elif "insurance (y/n)" in prompt:
+            player = int(prompt.split('"')[1][1:])
+            answer = "y" if scenario.insurance[player] > 0 else "n"
+        elif prompt.startswith("How much insurance"):
+            answer = str(scenario.insurance[player])
+        elif "1.) split" in prompt:
+            decision = decisions.pop(0) if decisions else STAND
+            if decision in (SPLIT, DOUBLE):
+                answer = "1" if decision == SPLIT else "2"
+            else:
+                answer = "3"
+                pending = "1" if decision == HIT else "2"
+        elif "(y/n)" in prompt:
+            offered = SPLIT if "split" in prompt else DOUBLE
+            decision = decisions.pop(0) if decisions else STAND
+            if decision == offered:
+                answer = "y"
+            else:
+                answer = "n"
+                pending = "1" if decision == HIT else "2"
+        elif "1.) hit" in prompt:
+            if pending is not None:
+                (answer, pending) = (pending, None)
+            else:
+                decision = decisions.pop(0) if decisions else STAND
+                answer = "1" if decision == HIT else "2"
+        else:
+            answer = ""
+        prompt = yield answer
+
+
+def run_reference(scenario: Scenario) -> Dict:
+    """Plays the scenario through BlackjackGame's own round logic."""
+    num_players = len(scenario.bets)
+    game = BlackjackGame(
+        num_players, 1, scenario.min_bet, scenario.max_bet,
+        scenario.starting_chips,
+        i_manager=ScriptedInputManager(
+            responder=_reference_answers(scenario)))
+    for (i, player) in enumerate(game.human_players):
+        player.name = f"p{i}"
+    game.shoe = scenario.shoe()
+    game._init_betting()
+
+    # same steps as one pass of BlackjackGame.play's loop
+    with contextlib.redirect_stdout(io.StringIO()):
+        game._collect_bets()
+        try:
+            game._deal_hands()
+            dealer_blackjack = game._player_actions()
+            if not dealer_blackjack:
+                game._dealer_actions()
+        except NoMoreCardsError:
+            game._refund_bets()
+            return _outcome([p.chips for p in game.human_players], None,
+                            None, None, True)
+        game._settle_payments(dealer_blackjack)
+
+    hands = []
+    for player in game.human_players:
+        if player in game.split_players:
+            hands.extend(player.hand)
+        else:
+            hands.append(player.hand)
+    return _outcome([p.chips for p in game.human_players], hands,
+                    game.dealer.hand, game.shoe.num_cards, False)
+
+
+class ScriptedStrategy(Strategy):
+    """Bets, insures and decides exactly as a scenario says."""
+
+    name = "scripted"
+
+    def __init__(self, scenario: Scenario) -> None:
+        self._bets = iter(scenario.bets)
+        self._insurance = iter(scenario.insurance)
+        self._decisions = list(scenario.decisions)
+
+    def bet(self, chips, min_bet, max_bet):
+        return next(self._bets)
+
+    def insurance(self, hand, bet, chips):
+        return next(self._insurance)
+
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        decision = self._decisions.pop(0) if self._decisions else STAND
+        if ((decision == SPLIT and not can_split) or
+                (decision == DOUBLE and not can_double)):
+            return STAND
+        return decision
+
+
+def run_table(scenario: Scenario, table_class=Table, **kwargs) -> Dict:
+    """Plays the scenario on the simulation engine's Table."""
+    table = table_class(len(scenario.bets), 1, scenario.min_bet,
+                        scenario.max_bet, scenario.starting_chips,
+                        ScriptedStrategy(scenario), **kwargs)
+    table.shoe = scenario.shoe(rng=table.rng)
+    table.play_round()
+
+    (hands, dealer_hand) = table.last_hands
+    return _outcome(table.chips, [hand for (_, hand) in hands], dealer_hand,
+                    table.shoe.num_cards, table.stats.reshuffles > 0)
+
+
+def run_rule_table(scenario: Scenario) -> Dict:
+    """Plays the scenario on a RuleTable with the default rules."""
+    return run_table(scenario, RuleTable, rules=RuleSet())
+
+
+# fast engines checked against the reference game
+ENGINES: Dict[str, Callable[[Scenario], Dict]] = {"table": run_table,
+                                                  "rules": run_rule_table}
+
+
+def random_scenario(rng: random.Random) -> Scenario:
+    """Random round, biased towards pairs, doubles and dealer aces."""
+    num_players = rng.randint(1, 3)
+    pool = list(range(52)) * 2
+    rng.shuffle(pool)
+    deal_order = pool[:rng.randint(2 * num_players + 2, 30)]
+
+    # player i is dealt cards i and num_players + i, dealer gets the next two
+    for i in range(num_players):
+        if rng.random() < 0.3 and num_players + i < len(deal_order):
+            deal_order[num_players + i] = (deal_order[i] // 4) * 4 + rng.randint(0, 3)
+    if rng.random() < 0.25:
+        deal_order[2 * num_players] = rng.randint(0, 3)
+
+    starting_chips = rng.choice([20, 100])
+    # bets and insurance the reference game accepts, or it would re-prompt
+    bets = [rng.randint(1, min(starting_chips, rng.choice([10, 50])))
+            for _ in range(num_players)]
+    insurance = [rng.randint(0, min(bet // 2, starting_chips - bet))
+                 if rng.random() < 0.5 else 0 for bet in bets]
+    decisions = [rng.choice([HIT, HIT, STAND, DOUBLE, SPLIT])
+                 for _ in range(rng.randint(0, 12))]
+    return Scenario(deal_order, bets, insurance, decisions, starting_chips)
+
+
+def mismatch(scenario: Scenario, engine: Callable) -> Optional[tuple]:
+    """Returns (reference, engine) outcomes if they differ, else None."""
+    reference = run_reference(scenario)
+    fast = engine(scenario)
+    if reference != fast:
+        return (reference, fast)
+    return None
+
+
+def _smaller(scenario: Scenario):
+    """Candidate simplifications, most aggressive first."""
+    for field in ("deal_order", "decisions"):
+        values = getattr(scenario, field)
+        size = len(values) // 2
+        while size >= 1:
+            for start in range(0, len(values), size):
+                yield scenario.copy(**{field: values[:start] + values[start + size:]})
+            size //= 2
+    num_players = len(scenario.bets)
+    if num_players > 1:
+        for i in range(num_players):
+            bets = scenario.bets[:i] + scenario.bets[i + 1:]
+            insurance = scenario.insurance[:i] + scenario.insurance[i + 1:]
+            deal_order = [code for (j, code) in enumerate(scenario.deal_order)
+                          if j not in (i, num_players + i)]
+            # the player's decisions are some unknown run of the shared list
+            decisions = scenario.decisions
+            for start in range(len(decisions) + 1):
+                for end in range(start, len(decisions) + 1):
+                    yield scenario.copy(
+                        deal_order=deal_order, bets=bets, insurance=insurance,
+                        decisions=decisions[:start] + decisions[end:])
+            yield scenario.copy(bets=bets, insurance=insurance)
+    for (i, amount) in enumerate(scenario.insurance):
+        if amount > 0:
+            yield scenario.copy(insurance=scenario.insurance[:i] + [0] +
+                                scenario.insurance[i + 1:])
+
+
+def shrink(scenario: Scenario, engine: Callable) -> Scenario:
+    """Greedily simplifies a failing scenario while it keeps failing."""
+    improved = True
+    while improved:
+        improved = False
+        for candidate in _smaller(scenario):
+            if mismatch(candidate, engine):
+                scenario = candidate
+                improved = True
+                break
+    return scenario
+
+
+def check_engine(engine: Callable, trials: int,
+                 seed: int = 0) -> Optional[Scenario]:
+    """Returns a shrunk failing scenario, or None if all trials agree."""
+    rng = random.Random(seed)
+    for _ in range(trials):
+        scenario = random_scenario(rng)
+        if mismatch(scenario, engine):
+            return shrink(scenario, engine)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Check fast engines against the reference game")
+    parser.add_argument("-n", "--trials", type=int, default=2000,
+                        help="Random scenarios per engine")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for scenario generation")
+    parser.add_argument("-e", "--engine", nargs="+", default=sorted(ENGINES),
+                        choices=sorted(ENGINES), help="Engines to check")
+
+    args = vars(parser.parse_args())
+    failed = False
+    for name in args["engine"]:
+        failing = check_engine(ENGINES[name], args["trials"], args["seed"])
+        if failing is None:
+            print(f"{name}: {args['trials']} scenarios match the reference")
+        else:
+            failed = True
+            (reference, fast) = mismatch(failing, ENGINES[name])
+            print(f"{name}: mismatch\n\t{failing}\n"
+                  f"\treference: {reference}\n\t{name}: {fast}")
+    exit(1 if failed else 0)
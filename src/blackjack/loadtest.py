@@ -0,0 +1,111 @@
+import argparse
+import contextlib
+import cProfile
+import os
+import pstats
+import random
+import time
+
+from blackjack.blackjackgame import BlackjackGame
+from inputmanager import ScriptedInputManager
+
+
+def bot_answers(rng: random.Random, max_answers: int, junk_rate=0.05):
+    """
+    Generator answering BlackjackGame prompts like a (sometimes careless) player.
+
+    Every so often gives an invalid answer to exercise the validation paths.
+    Stops after max_answers, which ends the game as EOF would.
+    """
+    prompt = yield
+    for i in range(max_answers):
+        if rng.random() < junk_rate:
+            answer = rng.choice(["", "abc", "-1", "99999", "maybe"])
+        elif prompt.startswith("Select name"):
+            answer = f"bot{i}"
+        elif prompt.startswith("Enter bet"):
+            answer = str(rng.randint(1, 50))
+        elif "(y/n)" in prompt:
+            answer = rng.choice(["y", "n"])
+        elif prompt.startswith("How much insurance"):
+            answer = str(rng.randint(0, 5))
+        elif "1.)" in prompt:
+            answer = rng.choice(["1", "2"])
+        else:
+            answer = ""
+        prompt = yield answer
+
+
+def run_session(seed: int, num_players: int, num_decks: int,
+                max_answers: int) -> ScriptedInputManager:
+    """Plays one scripted game through the real BlackjackGame until the script ends."""
+    rng = random.Random(seed)
+    i_manager = ScriptedInputManager(
+        responder=bot_answers(rng, max_answers))
+    game = BlackjackGame(num_players, num_decks, 2, 500, 500,
+                         i_manager=i_manager, seed=seed)
+    try:
+        game.play()
+    except SystemExit:
+        pass
+    return i_manager
+
+
+def run_load_test(sessions: int, num_players: int, num_decks: int,
+                  max_answers: int, seed: int = 0):
+    """Returns list of (duration, seed, answers used), one per session."""
+    timings = []
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        for session_seed in range(seed, seed + sessions):
+            start = time.perf_counter()
+            i_manager = run_session(session_seed, num_players, num_decks,
+                                    max_answers)
+            timings.append((time.perf_counter() - start, session_seed,
+                            i_manager.answers_used))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Play scripted sessions through the interactive game")
+    parser.add_argument("-n", "--sessions", type=int, default=1000,
+                        help="Number of scripted sessions")
+    parser.add_argument("-np", "--num_players", type=int, default=3,
+                        help="Number of players per session")
+    parser.add_argument("-nd", "--num_decks", type=int, default=1,
+                        help="Number of decks in shoe")
+    parser.add_argument("-a", "--max_answers", type=int, default=200,
+                        help="Answers given before a session quits")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the first session")
+    parser.add_argument("--slowest", type=int, default=5,
+                        help="Number of slowest sessions to report")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the top functions by cumulative time")
+
+    args = vars(parser.parse_args())
+    profiler = cProfile.Profile() if args["profile"] else None
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    timings = run_load_test(max(1, args["sessions"]),
+                            max(1, args["num_players"]),
+                            max(1, args["num_decks"]),
+                            max(1, args["max_answers"]), args["seed"])
+    elapsed = time.perf_counter() - start
+    if profiler:
+        profiler.disable()
+
+    durations = sorted(t[0] for t in timings)
+    print(f"{len(timings)} sessions in {elapsed:.2f}s "
+          f"({len(timings) / elapsed * 60:.0f} sessions/min, "
+          f"{sum(t[2] for t in timings)} answers)")
+    print(f"median {durations[len(durations) // 2] * 1000:.2f}ms, "
+          f"p99 {durations[int(len(durations) * 0.99)] * 1000:.2f}ms, "
+          f"max {durations[-1] * 1000:.2f}ms")
+    print("slowest sessions (seed: duration):")
+    for (duration, session_seed, _) in sorted(timings, reverse=True)[:args["slowest"]]:
+        print(f"\t- {session_seed}: {duration * 1000:.2f}ms")
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
@@ -0,0 +1,150 @@
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+MAGIC = b"BJCP"
+# version 3 saves the bets of a game quit before its round was dealt,
+# version 4 the side bets tables offer and their results, version 5 the
+# rules a table plays
+FORMAT_VERSION = 5
+
+# what a checkpoint holds
+KIND_GAME = 1
+KIND_TABLE = 2
+
+_HEADER = struct.Struct("<4sBB")
+_MT_STATE = struct.Struct("<625I")
+
+
+class CheckpointError(Exception):
+    """Error raised for a corrupt checkpoint, or one that can't be taken"""
+    pass
+
+
+class Writer:
+    """Builds a checkpoint: header, little-endian fields and a CRC32 trailer."""
+
+    def __init__(self, kind: int) -> None:
+        self._parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, kind)]
+
+    def int64(self, value: int) -> None:
+        self._parts.append(struct.pack("<q", value))
+
+    def float64(self, value: float) -> None:
+        self._parts.append(struct.pack("<d", value))
+
+    def number(self, value) -> None:
+        """Chips and totals, which may be ints or floats."""
+        self.float64(value)
+
+    def blob(self, value: bytes) -> None:
+        self._parts.append(struct.pack("<I", len(value)))
+        self._parts.append(value)
+
+    def text(self, value: str) -> None:
+        self.blob(value.encode("utf-8"))
+
+    def rng_state(self, state: tuple) -> None:
+        """State from random.getstate() or random.Random().getstate()."""
+        (version, internal, gauss_next) = state
+        self.int64(version)
+        self._parts.append(_MT_STATE.pack(*internal))
+        self.int64(gauss_next is not None)
+        self.float64(gauss_next or 0.0)
+
+    def getvalue(self) -> bytes:
+        data = b"".join(self._parts)
+        return data + struct.pack("<I", zlib.crc32(data))
+
+
+class Reader:
+    """Reads fields back in the order a Writer wrote them."""
+
+    def __init__(self, data: bytes, kind: int) -> None:
+        if len(data) < _HEADER.size + 4:
+            raise CheckpointError("Checkpoint is truncated")
+        (crc,) = struct.unpack_from("<I", data, len(data) - 4)
+        if zlib.crc32(data[:-4]) != crc:
+            raise CheckpointError("Checkpoint is corrupt")
+        (magic, version, data_kind) = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise CheckpointError("Not a checkpoint of this version")
+        if data_kind != kind:
+            raise CheckpointError(
+                f"Checkpoint holds kind {data_kind}, expected {kind}")
+        self._data = memoryview(data)[:-4]
+        self._offset = _HEADER.size
+
+    def _unpack(self, fmt: str):
+        values = struct.unpack_from(fmt, self._data, self._offset)
+        self._offset += struct.calcsize(fmt)
+        return values
+
+    def int64(self) -> int:
+        return self._unpack("<q")[0]
+
+    def float64(self) -> float:
+        return self._unpack("<d")[0]
+
+    def number(self):
+        value = self.float64()
+        return int(value) if value.is_integer() else value
+
+    def blob(self) -> bytes:
+        (length,) = self._unpack("<I")
+        value = bytes(self._data[self._offset:self._offset + length])
+        self._offset += length
+        return value
+
+    def text(self) -> str:
+        return self.blob().decode("utf-8")
+
+    def rng_state(self) -> tuple:
+        version = self.int64()
+        internal = self._unpack("<625I")
+        has_gauss = self.int64()
+        gauss_next = self.float64()
+        return (version, internal, gauss_next if has_gauss else None)
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Replaces path with data, so a crash never leaves a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Checkpointer:
+    """Writes checkpoints to a path at most once every interval seconds."""
+
+    def __init__(self, path: str, interval: float = 5.0) -> None:
+        self.path = path
+        self.interval = interval
+        self._last_save = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, data: bytes) -> None:
+        write_atomic(self.path, data)
+        self._last_save = time.monotonic()
+
+    def remove(self) -> None:
+        """Drops the checkpoint once the run it belongs to has finished."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
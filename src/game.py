@@ -3,6 +3,6 @@ from inputmanager import InputManager
 
 
 class Game:
-    def __init__(self, players):
+    def __init__(self, players, i_manager=None):
         self.players = players
-        self.i_manager = InputManager()
+        self.i_manager = i_manager if i_manager is not None else InputManager()
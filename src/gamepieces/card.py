@@ -1,3 +1,6 @@
+import itertools
+
+
 class Card:
     RANKS_TO_NAMES = {1: "Ace", 2: "Two", 3: "Three", 4: "Four", 5: "Five",
                       6: "Six", 7: "Seven", 8: "Eight", 9: "Nine", 10: "Ten",
@@ -5,9 +8,23 @@ class Card:
 
     SUITS_TO_NAMES = {0: "Clubs", 1: "Diamonds", 2: "Hearts", 3: "Spades"}
 
+    # card names are built once rather than on every redraw
+    NAMES = {(rank, suit): f"{rank_name} of {suit_name}"
+             for ((rank, rank_name), (suit, suit_name))
+             in itertools.product(RANKS_TO_NAMES.items(),
+                                  SUITS_TO_NAMES.items())}
+
     def __init__(self, rank: int, suit: int):
         self.rank = rank
         self.suit = suit
 
     def __str__(self):
-        return f"{Card.RANKS_TO_NAMES[self.rank]} of {Card.SUITS_TO_NAMES[self.suit]}"
+        return Card.NAMES[(self.rank, self.suit)]
+
+    def to_code(self) -> int:
+        """Compact encoding of the card in 0-51, (rank - 1) * 4 + suit."""
+        return (self.rank - 1) * 4 + self.suit
+
+    @staticmethod
+    def from_code(code: int) -> "Card":
+        return Card(code // 4 + 1, code % 4)
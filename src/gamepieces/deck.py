@@ -21,7 +21,4 @@ class Deck:
         return len(self.cards)
 
     def __str__(self):
-        str_rep = ""
-        for card in self._cards:
-            str_rep += str(card) + "\n"
-        return str_rep
+        return "".join(f"{card}\n" for card in self._cards)
@@ -1,10 +1,14 @@
+from gamepieces.card import Card
 from gamepieces.deck import Deck, NoMoreCardsError
+import metrics
 import random
 
 
 class Shoe:
-    def __init__(self, num_decks: int, shuffle=True):
+    def __init__(self, num_decks: int, shuffle=True, rng=None):
+        """rng defaults to the global random module."""
         self._num_decks = num_decks
+        self._rng = rng if rng is not None else random
         self._cards = []
         for i in range(num_decks):
             self._cards += Deck().cards
@@ -20,17 +24,26 @@ class Shoe:
         return len(self._cards)
 
     def shuffle(self):
-        num_shuffles = random.randint(3, 10)
+        num_shuffles = self._rng.randint(3, 10)
         for _ in range(num_shuffles):
-            random.shuffle(self._cards)
+            self._rng.shuffle(self._cards)
 
     def deal(self):
         if len(self._cards) == 0:
             raise NoMoreCardsError()
+        metrics.incr(metrics.CARDS_DEALT)
         return(self._cards.pop())
 
+    def to_codes(self) -> bytes:
+        """Remaining cards as compact card codes, in shoe order."""
+        return bytes(card.to_code() for card in self._cards)
+
+    @staticmethod
+    def from_codes(num_decks: int, codes: bytes, rng=None) -> "Shoe":
+        """Rebuilds a shoe holding exactly the given cards, in order."""
+        shoe = Shoe(num_decks, shuffle=False, rng=rng)
+        shoe._cards = [Card.from_code(code) for code in codes]
+        return shoe
+
     def __str__(self):
-        str_rep = ""
-        for card in self._cards:
-            str_rep += str(card) + "\n"
-        return str_rep
+        return "".join(f"{card}\n" for card in self._cards)
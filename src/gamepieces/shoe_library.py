@@ -0,0 +1,180 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import tempfile
+from typing import Iterator
+
+from gamepieces.card import Card
+from gamepieces.deck import NoMoreCardsError
+from gamepieces.shoe import Shoe
+import metrics
+
+MAGIC = b"BJSL"
+FORMAT_VERSION = 1
+
+# magic, version, decks per shoe, number of rows, seed the rows came from
+_HEADER = struct.Struct("<4sBBIq")
+
+# cards are never modified, so every shoe can deal the same 52 objects
+_CARDS = [Card.from_code(code) for code in range(52)]
+
+
+class ShoeLibraryError(Exception):
+    """Error raised when a shoe library file is corrupt or truncated"""
+    pass
+
+
+def generate(path: str, num_decks: int, num_rows: int, seed: int = 0,
+             rows_per_write: int = 4096) -> None:
+    """
+    Writes num_rows shuffled shoes of num_decks decks to path.
+
+    Each row is one uint8 card code per card, dealt from the first byte.
+    The file is replaced in one step once fully written.
+    """
+    rng = random.Random(seed)
+    codes = list(range(52)) * num_decks
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, num_decks, num_rows,
+                                 seed))
+            for start in range(0, num_rows, rows_per_write):
+                chunk = bytearray()
+                for _ in range(min(rows_per_write, num_rows - start)):
+                    rng.shuffle(codes)
+                    chunk += bytes(codes)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ShoeLibrary:
+    """
+    Read-only, memory-mapped file of pre-shuffled shoes.
+
+    Shoes dealt from the library read card codes straight out of the
+    mapping, so the same rows can be replayed by any number of runs
+    without shuffling or copying.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < _HEADER.size:
+            self._data.close()
+            raise ShoeLibraryError("Shoe library is truncated")
+        (magic, version, self.num_decks, self.num_rows,
+         self.seed) = _HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._data.close()
+            raise ShoeLibraryError("Not a shoe library of this version")
+        self.row_size = 52 * self.num_decks
+        if len(self._data) != _HEADER.size + self.num_rows * self.row_size:
+            self._data.close()
+            raise ShoeLibraryError("Shoe library is truncated")
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def _offset(self, row: int) -> int:
+        if not 0 <= row < self.num_rows:
+            raise IndexError(f"Row {row} not in library of {self.num_rows}")
+        return _HEADER.size + row * self.row_size
+
+    def codes(self, row: int) -> bytes:
+        """Copy of a row's card codes, in dealing order."""
+        offset = self._offset(row)
+        return self._data[offset:offset + self.row_size]
+
+    def shoe(self, row: int) -> "LibraryShoe":
+        return LibraryShoe(self, row)
+
+    def shoes(self, start: int = 0) -> Iterator["LibraryShoe"]:
+        """Shoes from row start onwards, wrapping around at the end."""
+        row = start
+        while True:
+            yield self.shoe(row % self.num_rows)
+            row += 1
+
+    def close(self) -> None:
+        self._data.close()
+
+    def __enter__(self) -> "ShoeLibrary":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class LibraryShoe(Shoe):
+    """
+    Shoe dealing one library row in order, straight from the mapping.
+
+    Shuffling is a no-op: the row already is the shuffle. Rebuilding from
+    to_codes gives an ordinary Shoe holding the same remaining cards.
+    """
+
+    def __init__(self, library: ShoeLibrary, row: int) -> None:
+        # no cards list to build, so Shoe.__init__ is not called
+        self._num_decks = library.num_decks
+        self._rng = None
+        self.library = library
+        self.row = row
+        self._data = library._data
+        self._next = library._offset(row)
+        self._end = self._next + library.row_size
+
+    @property
+    def num_cards(self):
+        return self._end - self._next
+
+    def shuffle(self):
+        pass
+
+    def deal(self):
+        if self._next == self._end:
+            raise NoMoreCardsError()
+        metrics.incr(metrics.CARDS_DEALT)
+        card = _CARDS[self._data[self._next]]
+        self._next += 1
+        return card
+
+    def to_codes(self) -> bytes:
+        # plain shoes deal from the end of their list
+        return bytes(reversed(self._data[self._next:self._end]))
+
+    def __str__(self):
+        return "".join(f"{_CARDS[code]}\n"
+                       for code in self._data[self._next:self._end])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Generate a file of pre-shuffled shoes")
+    parser.add_argument("path", help="Library file to write")
+    parser.add_argument("-nd", "--num_decks", type=int, default=6,
+                        help="Number of decks in each shoe")
+    parser.add_argument("-n", "--num_rows", type=int, default=10000,
+                        help="Number of shoes")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for shuffling")
+
+    args = vars(parser.parse_args())
+    if not 1 <= args["num_decks"] <= 255:
+        print("Number of decks must be between 1 and 255")
+        exit(1)
+    generate(args["path"], args["num_decks"], max(1, args["num_rows"]),
+             args["seed"])
+    with ShoeLibrary(args["path"]) as library:
+        print(f"Wrote {len(library)} shoes of {library.num_decks} decks "
+              f"({os.path.getsize(args['path'])} bytes) to {args['path']}")
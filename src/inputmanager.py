@@ -1,6 +1,7 @@
 import os
+import sys
 import time
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Generator, Iterable, Optional
 
 
 class InputManager:
@@ -12,21 +13,24 @@ class InputManager:
 
         time.sleep(self.TIME_DELAY * multiple)
 
+    def _read(self, prompt: str) -> str:
+        return input(prompt)
+
     def get_input(self, prompt: str,
                   is_valid: Callable[[Any], bool],
                   error_message: str,
                   quit_callback: Callable = None) -> Optional[str]:
         """
-        Read user input from terminal. 
+        Read user input from terminal.
 
         Returns None on interrupt unless options specified.
         """
 
         try:
-            user_input = input(prompt)
+            user_input = self._read(prompt)
             while is_valid and not is_valid(user_input):
                 print(error_message)
-                user_input = input(prompt)
+                user_input = self._read(prompt)
             return user_input
         except (EOFError, KeyboardInterrupt):
             if quit_callback:
@@ -35,8 +39,61 @@ class InputManager:
                 return None
 
     def clear_screen(self):
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            # ANSI clear and cursor home, no need to fork a shell
+            sys.stdout.write("\033[2J\033[H")
+            sys.stdout.flush()
 
     def enter_to_cont(self, message="Press enter to continue..."):
         self.get_input(message, is_valid=lambda x: True,
                        error_message="", quit_callback=lambda: exit(1))
+
+
+class ScriptedInputManager(InputManager):
+    """
+    Feeds answers from a script instead of the terminal, without any delays.
+
+    answers is an iterable of strings, used in order. responder is instead a
+    generator that is sent each prompt and yields the answer to it. Running
+    out of answers behaves like EOF at the terminal.
+    """
+
+    def __init__(self, answers: Iterable[str] = (),
+                 responder: Optional[Generator[str, str, None]] = None):
+        super().__init__()
+        self.TIME_DELAY = 0
+        self.answers_used = 0
+        self._responder = responder
+        self._answers = iter(answers)
+        if responder is not None:
+            # run to the first yield, ready to be sent a prompt
+            next(responder)
+
+    @staticmethod
+    def from_file(path: str) -> "ScriptedInputManager":
+        """One answer per line of the script file."""
+        with open(path) as f:
+            return ScriptedInputManager(f.read().splitlines())
+
+    def _read(self, prompt: str) -> str:
+        print(prompt, end="")
+        try:
+            if self._responder is not None:
+                answer = self._responder.send(prompt)
+            else:
+                answer = next(self._answers)
+        except StopIteration:
+            raise EOFError()
+        self.answers_used += 1
+        return answer
+
+    def time_delay(self, multiple=1.0):
+        pass
+
+    def clear_screen(self):
+        pass
+
+    def enter_to_cont(self, message="Press enter to continue..."):
+        pass
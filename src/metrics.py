@@ -0,0 +1,269 @@
+import argparse
+import fcntl
+import os
+import signal
+import sys
+import tempfile
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional
+
+# counters, in shared memory order
+COUNTERS = ("rounds", "hands", "cards_dealt", "reshuffles", "decisions",
+            "decision_ns", "wagered", "house_net", "hand_busts",
+            "busted_players")
+(ROUNDS, HANDS, CARDS_DEALT, RESHUFFLES, DECISIONS, DECISION_NS, WAGERED,
+ HOUSE_NET, HAND_BUSTS, BUSTED_PLAYERS) = range(len(COUNTERS))
+
+DEFAULT_NAME = "blackjack_metrics"
+DEFAULT_SLOTS = 256
+_ITEM_SIZE = 8
+# each row is the counters then the pid of the process writing it, 0 if free
+_ROW = len(COUNTERS) + 1
+_OWNER = len(COUNTERS)
+
+# this process's row of counters, None while metrics are disabled
+_counters = None
+_metrics = None
+_slot = None
+# blocks created by this process (or inherited by a forked child)
+_created = set()
+
+
+class Metrics:
+    """
+    Counters in shared memory, one row per writing process.
+
+    Each process claims a row of its own and only ever writes that row, so
+    updates need no locks. Readers sum the rows.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, create: bool = False,
+                 num_slots: int = DEFAULT_SLOTS) -> None:
+        if create:
+            self.shm = shared_memory.SharedMemory(
+                name, create=True, size=num_slots * _ROW * _ITEM_SIZE)
+            _created.add(self.shm.name)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            # only the creator should unlink the block, so stop this
+            # process's resource tracker from cleaning it up on exit
+            if self.shm.name not in _created:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.created = create
+        self.num_slots = self.shm.size // (_ROW * _ITEM_SIZE)
+        self._values = self.shm.buf.cast("d")
+
+    def row(self, slot: int) -> memoryview:
+        start = slot * _ROW
+        return self._values[start:start + len(COUNTERS)]
+
+    def _lock_path(self) -> str:
+        return os.path.join(tempfile.gettempdir(),
+                            self.shm.name.lstrip("/") + ".lock")
+
+    def claim(self) -> Optional[int]:
+        """
+        Takes a free row for this process, or the row of a process that has
+        exited, and returns its slot. None if every row is in use.
+
+        Claims hold a lock file, so two processes never take the same row.
+        A row taken over keeps its counts, which are still part of the
+        totals.
+        """
+        values = self._values
+        with open(self._lock_path(), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for slot in range(self.num_slots):
+                owner = int(values[slot * _ROW + _OWNER])
+                if owner == 0 or not _running(owner):
+                    values[slot * _ROW + _OWNER] = os.getpid()
+                    return slot
+        return None
+
+    def release(self, slot: int) -> None:
+        if int(self._values[slot * _ROW + _OWNER]) == os.getpid():
+            self._values[slot * _ROW + _OWNER] = 0
+
+    def totals(self) -> Dict[str, float]:
+        values = self._values.tolist()
+        return {counter: sum(values[i::_ROW])
+                for (i, counter) in enumerate(COUNTERS)}
+
+    def close(self) -> None:
+        self._values.release()
+        self.shm.close()
+        if self.created:
+            self.shm.unlink()
+            _created.discard(self.shm.name)
+            try:
+                os.unlink(self._lock_path())
+            except OSError:
+                pass
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to another user
+        pass
+    return True
+
+
+def enable(name: str = DEFAULT_NAME) -> None:
+    """
+    Start updating counters in the named shared memory block. Warns and
+    leaves metrics disabled if the block has no free row.
+    """
+    global _counters, _metrics, _slot
+    disable()
+    block = Metrics(name)
+    slot = block.claim()
+    if slot is None:
+        block.close()
+        warnings.warn(f"All {block.num_slots} rows of metrics block "
+                      f"\"{name}\" are in use, metrics are disabled")
+        return
+    (_metrics, _slot) = (block, slot)
+    _counters = block.row(slot)
+
+
+def disable() -> None:
+    global _counters, _metrics, _slot
+    if _metrics is not None:
+        _counters.release()
+        _counters = None
+        _metrics.release(_slot)
+        _slot = None
+        _metrics.close()
+        _metrics = None
+
+
+def _forget_after_fork() -> None:
+    """A forked child must claim its own row rather than share its parent's."""
+    global _counters, _metrics, _slot
+    (_counters, _metrics, _slot) = (None, None, None)
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
+
+
+def enabled() -> bool:
+    return _counters is not None
+
+
+def incr(counter: int, amount=1) -> None:
+    if _counters is not None:
+        _counters[counter] += amount
+
+
+def to_prometheus(totals: Dict[str, float], rates: Dict[str, float]) -> str:
+    lines = []
+    for counter in COUNTERS:
+        if counter == "house_net":
+            continue
+        lines.append(f"# TYPE blackjack_{counter}_total counter")
+        lines.append(f"blackjack_{counter}_total {totals[counter]:.0f}")
+
+    gauges = dict(rates)
+    # goes down when players win, and 3:2 payouts leave fractions
+    gauges["house_net"] = totals["house_net"]
+    gauges["decision_latency_seconds"] = (
+        totals["decision_ns"] / totals["decisions"] / 1e9
+        if totals["decisions"] else 0.0)
+    gauges["house_edge"] = (totals["house_net"] / totals["wagered"]
+                            if totals["wagered"] else 0.0)
+    for (gauge, value) in gauges.items():
+        lines.append(f"# TYPE blackjack_{gauge} gauge")
+        lines.append(f"blackjack_{gauge} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Exporter:
+    """Turns the shared counters into Prometheus text, with per-second rates."""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+        self._last = (time.monotonic(), metrics.totals())
+
+    def render(self) -> str:
+        now = time.monotonic()
+        totals = self.metrics.totals()
+        (last_time, last_totals) = self._last
+        elapsed = max(now - last_time, 1e-9)
+        rates = {
+            "hands_per_second":
+                (totals["hands"] - last_totals["hands"]) / elapsed,
+            "rounds_per_second":
+                (totals["rounds"] - last_totals["rounds"]) / elapsed,
+        }
+        self._last = (now, totals)
+        return to_prometheus(totals, rates)
+
+    def serve(self, port: int) -> None:
+        """Serves the text format at http://localhost:<port>/metrics."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+    def write_file(self, path: str) -> None:
+        """Atomically rewrites path with the current text format."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Create the shared metrics block and export it")
+    parser.add_argument("--name", default=DEFAULT_NAME,
+                        help="Shared memory block name")
+    parser.add_argument("--slots", type=int, default=DEFAULT_SLOTS,
+                        help="Maximum number of writing processes")
+    parser.add_argument("--port", type=int, default=9464,
+                        help="Serve /metrics on this localhost port")
+    parser.add_argument("--file", default=None,
+                        help="Periodically rewrite this file instead of serving")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="Seconds between file rewrites")
+
+    args = vars(parser.parse_args())
+    metrics = Metrics(args["name"], create=True, num_slots=args["slots"])
+    exporter = Exporter(metrics)
+    # unlink the block on kill as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args["file"]:
+            while True:
+                exporter.write_file(args["file"])
+                time.sleep(args["interval"])
+        else:
+            exporter.serve(args["port"])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metrics.close()
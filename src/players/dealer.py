@@ -20,12 +20,5 @@ class Dealer(Player):
 
     def hand_to_str(self, reveal_all=False, reveal_number=1):
         """Follows same reveal scheme as reveal_hand."""
-        str_rep = ""
-        if reveal_all:
-            for card in self.hand:
-                str_rep += "\t- " + str(card) + "\n"
-        else:
-            for i in range(reveal_number):
-                if i < len(self.hand):
-                    str_rep += "\t- " + str(self.hand[i]) + "\n"
-        return str_rep[:-1]
+        cards = self.hand if reveal_all else self.hand[:reveal_number]
+        return "\n".join(f"\t- {card}" for card in cards)
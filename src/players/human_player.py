@@ -9,10 +9,7 @@ class HumanPlayer(Player):
 
     def static_hand_to_str(hand):
         """Static version of string to hand"""
-        str_rep = ""
-        for card in hand:
-            str_rep += "\t- " + str(card) + "\n"
-        return str_rep[:-1]
+        return "\n".join(f"\t- {card}" for card in hand)
 
     @property
     def name(self):
@@ -36,11 +33,9 @@ class HumanPlayer(Player):
     def hand_to_str(self):
         # in case of multiple hands
         if any(isinstance(subhand, list) for subhand in self.hand):
-            str_rep = ""
-            for (i, subhand) in enumerate(self.hand):
-                str_rep += f"Subhand {i+1}\n" + \
-                    HumanPlayer.static_hand_to_str(subhand) + "\n"
-            return str_rep[:-1]
+            return "\n".join(
+                f"Subhand {i+1}\n" + HumanPlayer.static_hand_to_str(subhand)
+                for (i, subhand) in enumerate(self.hand))
         else:
             return HumanPlayer.static_hand_to_str(self.hand)
 
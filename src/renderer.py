@@ -0,0 +1,128 @@
+import argparse
+import sys
+import time
+from typing import List, TextIO
+
+from gamepieces.card import Card
+
+CLEAR = "\033[2J"
+CLEAR_LINE = "\033[K"
+
+RANKS_TO_SHORT = {1: "A", 11: "J", 12: "Q", 13: "K"}
+SUITS_TO_SYMBOLS = {0: "♣", 1: "♦", 2: "♥", 3: "♠"}
+
+# short card strings indexed by card code, built once
+CARD_STRS = [f"{RANKS_TO_SHORT.get(code // 4 + 1, str(code // 4 + 1))}"
+             f"{SUITS_TO_SYMBOLS[code % 4]}" for code in range(52)]
+
+
+def hand_str(hand: List[Card]) -> str:
+    return " ".join([CARD_STRS[card.to_code()] for card in hand])
+
+
+def move_to(row: int, col: int = 1) -> str:
+    """ANSI cursor position, rows and columns start at 1."""
+    return f"\033[{row};{col}H"
+
+
+class Renderer:
+    """
+    Draws frames of text lines to a terminal.
+
+    Only lines that differ from the previous frame are rewritten, and each
+    frame goes out in a single write.
+    """
+
+    def __init__(self, stream: TextIO = None) -> None:
+        self.stream = stream if stream is not None else sys.stdout
+        self._previous = None
+
+    def render(self, lines: List[str]) -> None:
+        out = []
+        if self._previous is None:
+            out.append(CLEAR)
+            previous = []
+        else:
+            previous = self._previous
+
+        for (row, line) in enumerate(lines):
+            if row >= len(previous) or previous[row] != line:
+                out.append(move_to(row + 1) + line + CLEAR_LINE)
+        # blank out rows the previous frame had but this one does not
+        for row in range(len(lines), len(previous)):
+            out.append(move_to(row + 1) + CLEAR_LINE)
+        out.append(move_to(len(lines) + 1))
+
+        self._previous = list(lines)
+        self.stream.write("".join(out))
+        self.stream.flush()
+
+    def reset(self) -> None:
+        """Redraw everything on the next frame, e.g. after other output."""
+        self._previous = None
+
+
+def table_lines(title: str, table, width: int) -> List[str]:
+    """Lines showing a simulation Table's players and last round."""
+    (hands, dealer_hand) = table.last_hands
+    lines = [f"{title} | round {table.round} | shoe {table.shoe.num_cards}",
+             f"  Dealer: {hand_str(dealer_hand)}"]
+    for (i, chips) in enumerate(table.chips):
+        cards = "  ".join(hand_str(hand) for (player_id, hand) in hands
+                          if player_id == table.player_ids[i])
+        lines.append(f"  P{table.player_ids[i]} ${chips:<7g} {cards}")
+    return [line[:width].ljust(width) for line in lines]
+
+
+def tile(blocks: List[List[str]], columns: int, width: int) -> List[str]:
+    """Lays out blocks of lines in a grid, columns blocks across."""
+    lines = []
+    for start in range(0, len(blocks), columns):
+        row = blocks[start:start + columns]
+        height = max(len(block) for block in row)
+        for i in range(height):
+            lines.append(" | ".join(block[i] if i < len(block)
+                                    else " " * width for block in row))
+        lines.append("")
+    return lines
+
+
+if __name__ == "__main__":
+    from simulation.engine import Table
+    from simulation.strategies import get_strategy, parse_strategy
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Watch many simulated tables on one terminal")
+    parser.add_argument("-t", "--tables", type=int, default=6,
+                        help="Number of tables")
+    parser.add_argument("-np", "--num_players", type=int, default=3,
+                        help="Players per table")
+    parser.add_argument("-nd", "--num_decks", type=int, default=4,
+                        help="Number of decks in shoe")
+    parser.add_argument("-s", "--strategy", default="basic",
+                        type=parse_strategy,
+                        help="Bot strategy, hilo@path plays a saved index "
+                             "table")
+    parser.add_argument("-r", "--rounds", type=int, default=200,
+                        help="Rounds to play")
+    parser.add_argument("-c", "--columns", type=int, default=3,
+                        help="Tables per row")
+    parser.add_argument("-w", "--width", type=int, default=40,
+                        help="Characters per table")
+    parser.add_argument("--delay", type=float, default=0.1,
+                        help="Seconds between frames")
+
+    args = vars(parser.parse_args())
+    tables = [Table(args["num_players"], args["num_decks"], 2, 500, 500,
+                    get_strategy(args["strategy"]), seed=i)
+              for i in range(max(1, args["tables"]))]
+    renderer = Renderer()
+    for _ in range(args["rounds"]):
+        for table in tables:
+            table.play_round()
+        renderer.render(tile([table_lines(f"Table {i + 1}", table,
+                                          args["width"])
+                              for (i, table) in enumerate(tables)],
+                             max(1, args["columns"]), args["width"]))
+        time.sleep(args["delay"])
@@ -0,0 +1,554 @@
+import argparse
+import math
+import os
+import random
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from gamepieces.card import Card
+from simulation.engine import ENGINE_VERSION
+from simulation.rules import (RANK_VALUES, RULE_PRESETS, CompiledRules,
+                              get_rules)
+from simulation.sequential import RunningStats
+from simulation.strategies import (ACTION_NAMES, HILO_VALUES, HIT, STAND,
+                                   DOUBLE, SPLIT, IndexTable, Strategy,
+                                   get_strategy)
+from simulation.sweep import (DEFAULT_CACHE_DIR, ResultCache, cell_key,
+                              session_seed)
+
+# a situation is (player rank, player rank, upcard rank), aces are rank 1
+Situation = Tuple[int, int, int]
+
+LOW_RANKS = (2, 3, 4, 5, 6)
+NEUTRAL_RANKS = (7, 8, 9)
+HIGH_RANKS = (1, 10, 11, 12, 13)
+
+# cards are never modified, so hands can share one card per rank
+CARDS = [None] + [Card(rank, 0) for rank in range(1, 14)]
+
+
+def _upcard_name(rank: int) -> str:
+    return "A" if rank == 1 else str(RANK_VALUES[rank])
+
+
+def situations() -> Dict[str, Situation]:
+    """
+    Every two card hand against every upcard, named like 16v10 for hard
+    totals, s18v9 for soft ones and 8,8vA for pairs.
+
+    Hard totals are dealt as a ten and the rest where they can be, which
+    is the most common way to hold them.
+    """
+    hands = {}
+    for total in range(5, 20):
+        first = 10 if total >= 12 else total - 2
+        hands[str(total)] = (first, total - first)
+    for total in range(13, 21):
+        hands[f"s{total}"] = (1, total - 11)
+    for rank in range(1, 11):
+        hands[f"{_upcard_name(rank)},{_upcard_name(rank)}"] = (rank, rank)
+    return {f"{hand}v{_upcard_name(upcard)}": cards + (upcard,)
+            for (hand, cards) in hands.items()
+            for upcard in (2, 3, 4, 5, 6, 7, 8, 9, 10, 1)}
+
+
+def _remove(counts: List[int], ranks: Tuple[int, ...], number: int) -> None:
+    """Removes number cards from ranks in proportion to what is left."""
+    available = sum(counts[rank] for rank in ranks)
+    shares = [(counts[rank] * number / available, rank) for rank in ranks]
+    removed = {rank: int(share) for (share, rank) in shares}
+    # largest remainders take the cards left over after rounding down
+    leftover = number - sum(removed.values())
+    for (share, rank) in sorted(shares, key=lambda x: int(x[0]) - x[0])[
+            :leftover]:
+        removed[rank] += 1
+    for (rank, number) in removed.items():
+        counts[rank] -= number
+
+
+def composition_at(seen: Tuple[int, ...], true_count: int,
+                   num_decks: int, depth: float) -> List[int]:
+    """
+    Cards left by rank, after depth of the shoe has been dealt including
+    the seen ranks, with the Hi-Lo count of everything dealt at true_count
+    per deck left. The other cards dealt are taken in proportion from each
+    count class and each rank in it.
+
+    Raises ValueError if the shoe can't hold that count at that depth.
+    """
+    counts = [0] + [4 * num_decks] * 13
+    for rank in seen:
+        counts[rank] -= 1
+    num_cards = num_decks * 52
+    left = round(num_cards * (1 - depth))
+    dealt = num_cards - left - len(seen)
+    count = (round(true_count * left / 52) -
+             sum(HILO_VALUES[rank] for rank in seen))
+    # neutral cards in proportion, then low minus high cards dealt is count
+    neutral = round(dealt * 12 / 52)
+    if (dealt - neutral + count) % 2:
+        neutral += 1
+    low = (dealt - neutral + count) // 2
+    high = dealt - neutral - low
+    for (ranks, number) in ((LOW_RANKS, low), (NEUTRAL_RANKS, neutral),
+                            (HIGH_RANKS, high)):
+        if not 0 <= number <= sum(counts[rank] for rank in ranks):
+            raise ValueError(f"True count {true_count} is out of reach at "
+                             f"depth {depth}")
+        _remove(counts, ranks, number)
+    return counts
+
+
+def insurance_ev(true_count: int, num_decks: int, depth: float) -> float:
+    """Net result of a unit insurance bet, paying 2:1 when the hole is ten."""
+    counts = composition_at((1,), true_count, num_decks, depth)
+    return 3 * sum(counts[10:]) / sum(counts) - 1
+
+
+class _Stream:
+    """
+    Cards of one sample in the order they are dealt, drawn from what is
+    left as they are first needed, so every action sees the same cards.
+    """
+
+    def __init__(self, ranks: List[int], rng: random.Random) -> None:
+        self._ranks = list(ranks)
+        self._rng = rng
+        self._dealt = []
+        self._position = 0
+
+    def reset(self) -> None:
+        self._position = 0
+
+    def deal(self) -> int:
+        dealt = self._dealt
+        if self._position == len(dealt):
+            ranks = self._ranks
+            i = int(self._rng.random() * len(ranks))
+            (ranks[i], ranks[-1]) = (ranks[-1], ranks[i])
+            dealt.append(ranks.pop())
+        self._position += 1
+        return dealt[self._position - 1]
+
+
+def _situation_state(situation: Situation, rules: CompiledRules) -> int:
+    (first, second, _) = situation
+    return rules.next_state[rules.next_state[0][first]][second]
+
+
+def candidate_actions(situation: Situation,
+                      rules: CompiledRules) -> List[int]:
+    actions = [HIT, STAND]
+    if rules.can_double[_situation_state(situation, rules)]:
+        actions.append(DOUBLE)
+    if situation[0] == situation[1] and rules.max_splits > 0:
+        actions.append(SPLIT)
+    return actions
+
+
+def basic_action(situation: Situation, rules: CompiledRules,
+                 strategy: Strategy) -> int:
+    (first, second, upcard) = situation
+    state = _situation_state(situation, rules)
+    actions = candidate_actions(situation, rules)
+    return strategy.action(rules.total[state], rules.soft[state],
+                           11 if upcard == 1 else RANK_VALUES[upcard],
+                           DOUBLE in actions, SPLIT in actions,
+                           [CARDS[first], CARDS[second]])
+
+
+def _play_out(state: int, hand: List[Card], upcard: int, stream: _Stream,
+              rules: CompiledRules, strategy: Strategy) -> int:
+    """Hit or stand by strategy until it stands or the hand busts."""
+    while rules.total[state] <= 21:
+        if strategy.action(rules.total[state], rules.soft[state], upcard,
+                           False, False, hand) != HIT:
+            break
+        rank = stream.deal()
+        hand.append(CARDS[rank])
+        state = rules.next_state[state][rank]
+    return state
+
+
+def play_action(action: int, situation: Situation, stream: _Stream,
+                rules: CompiledRules, strategy: Strategy) -> float:
+    """
+    Net result per unit bet of taking action with the situation's hand,
+    then playing on by strategy. The stream's first card is the dealer's
+    hole card, which must not make a dealer blackjack.
+    """
+    (first, second, upcard_rank) = situation
+    upcard = 11 if upcard_rank == 1 else RANK_VALUES[upcard_rank]
+    next_state = rules.next_state
+    total = rules.total
+    stream.reset()
+    hole = stream.deal()
+
+    # each entry is (bet, total, blackjack)
+    hands = []
+    if action == SPLIT:
+        for rank in (first, second):
+            state = next_state[0][rank]
+            hand = [CARDS[rank]]
+            bet = 1
+            rank = stream.deal()
+            hand.append(CARDS[rank])
+            state = next_state[state][rank]
+            if total[state] < 21 and rules.can_double_split[state] and (
+                    strategy.action(total[state], rules.soft[state], upcard,
+                                    True, False, hand) == DOUBLE):
+                bet = 2
+                rank = stream.deal()
+                hand.append(CARDS[rank])
+                state = next_state[state][rank]
+            else:
+                state = _play_out(state, hand, upcard, stream, rules,
+                                  strategy)
+            blackjack = (rules.split_blackjack and len(hand) == 2 and
+                         total[state] == 21)
+            hands.append((bet, total[state], blackjack))
+    else:
+        state = _situation_state(situation, rules)
+        bet = 1
+        if action == DOUBLE:
+            bet = 2
+            state = next_state[state][stream.deal()]
+        elif action == HIT:
+            hand = [CARDS[first], CARDS[second]]
+            rank = stream.deal()
+            hand.append(CARDS[rank])
+            state = _play_out(next_state[state][rank], hand, upcard, stream,
+                              rules, strategy)
+        hands.append((bet, total[state], False))
+
+    dealer_total = 0
+    if any(hand_total <= 21 for (_, hand_total, _) in hands):
+        state = next_state[next_state[0][upcard_rank]][hole]
+        while rules.dealer_hits[state]:
+            state = next_state[state][stream.deal()]
+        dealer_total = total[state]
+
+    net = 0.0
+    for (bet, hand_total, blackjack) in hands:
+        if blackjack:
+            net += bet * (rules.blackjack_multiple - 1)
+        elif hand_total > 21:
+            net -= bet
+        elif dealer_total > 21 or hand_total > dealer_total:
+            net += bet
+        elif hand_total < dealer_total:
+            net -= bet
+    return net
+
+
+def evaluate_batch(task: Tuple[Situation, int, str, int, float, int,
+                               int]) -> dict:
+    """
+    Results of every candidate action over samples dealt at one true
+    count. Each sample deals all actions the same cards, and diffs are
+    each action's result minus basic strategy's on the same sample.
+
+    Samples where the dealer has blackjack are left out, as the dealer
+    peeks and no action changes the result.
+    """
+    (situation, true_count, rules_name, num_decks, depth, samples,
+     seed) = task
+    rules = get_rules(rules_name).compile()
+    strategy = get_strategy("basic")
+    counts = composition_at(situation, true_count, num_decks, depth)
+    ranks = [rank for rank in range(1, 14) for _ in range(counts[rank])]
+    actions = candidate_actions(situation, rules)
+    basic = basic_action(situation, rules, strategy)
+    dealer_state = rules.next_state[0][situation[2]]
+
+    rng = random.Random(seed)
+    nets = {action: RunningStats() for action in actions}
+    diffs = {action: RunningStats() for action in actions}
+    for _ in range(samples):
+        stream = _Stream(ranks, rng)
+        if rules.total[rules.next_state[dealer_state][stream.deal()]] == 21:
+            continue
+        results = {action: play_action(action, situation, stream, rules,
+                                       strategy)
+                   for action in actions}
+        for action in actions:
+            nets[action].add(results[action])
+            diffs[action].add(results[action] - results[basic])
+    return {"nets": {ACTION_NAMES[action]: stats.to_dict()
+                     for (action, stats) in nets.items()},
+            "diffs": {ACTION_NAMES[action]: stats.to_dict()
+                      for (action, stats) in diffs.items()}}
+
+
+class IndexSearch:
+    """
+    Batched simulations of situations at true counts, for finding the
+    counts where a deviation from basic strategy starts to pay.
+
+    Every batch is kept in the result cache under its situation, true
+    count and batch number, so asking for more batches only simulates the
+    new ones and refining one index never repeats the rest of the search.
+    """
+
+    def __init__(self, rules: str = "reference", num_decks: int = 6,
+                 depth: float = 0.5, samples: int = 2000, seed: int = 0,
+                 cache: ResultCache = None,
+                 processes: Optional[int] = None) -> None:
+        self.rules = rules
+        self.num_decks = num_decks
+        self.depth = depth
+        self.samples = samples
+        self.seed = seed
+        self.cache = cache if cache is not None else ResultCache()
+        self.processes = processes
+        self.situations = situations()
+        self.batches_simulated = 0
+
+    def _key(self, name: str, true_count: int) -> str:
+        return cell_key({"deviation": name, "true_count": true_count,
+                         "rules": self.rules, "num_decks": self.num_decks,
+                         "depth": self.depth, "samples": self.samples},
+                        self.seed)
+
+    def reachable(self, name: str, true_count: int) -> bool:
+        try:
+            composition_at(self.situations[name], true_count,
+                           self.num_decks, self.depth)
+        except ValueError:
+            return False
+        return True
+
+    def gather(self, cells: List[Tuple[str, int]],
+               batches: int) -> Dict[Tuple[str, int], dict]:
+        """
+        {(name, true count): {"nets": ..., "diffs": ...}} of RunningStats
+        per action name, merged over the first batches batches of each
+        cell. Missing batches of all cells are simulated in one pool.
+        """
+        entries = {}
+        tasks = []
+        owners = []
+        for (name, true_count) in cells:
+            key = self._key(name, true_count)
+            for batch in range(batches):
+                batch_key = f"{key}:{batch}"
+                entry = self.cache.get(batch_key)
+                if entry is None:
+                    tasks.append((self.situations[name], true_count,
+                                  self.rules, self.num_decks, self.depth,
+                                  self.samples, session_seed(key, batch)))
+                    owners.append(batch_key)
+                entries[(name, true_count, batch)] = entry
+
+        if tasks:
+            with Pool(self.processes) as pool:
+                results = pool.map(evaluate_batch, tasks)
+            for (batch_key, result) in zip(owners, results):
+                self.cache.put(batch_key, dict(result,
+                                               engine_version=ENGINE_VERSION))
+            self.batches_simulated += len(tasks)
+            completed = dict(zip(owners, results))
+            for ((name, true_count, batch), entry) in entries.items():
+                if entry is None:
+                    key = f"{self._key(name, true_count)}:{batch}"
+                    entries[(name, true_count, batch)] = completed[key]
+
+        merged = {}
+        for ((name, true_count, _), entry) in entries.items():
+            cell = merged.setdefault((name, true_count),
+                                     {"nets": {}, "diffs": {}})
+            for kind in ("nets", "diffs"):
+                for (action, values) in entry[kind].items():
+                    cell[kind].setdefault(action, RunningStats()).merge(
+                        RunningStats.from_dict(values))
+        return merged
+
+
+def fit_index(points: Dict[int, RunningStats]) -> Optional[Tuple[float, bool]]:
+    """
+    (true count, above) where a line fitted through the mean difference
+    at each true count, weighted by its precision, crosses zero. above
+    is True when the difference grows with the count. None if the line is
+    flat or the difference is never clearly above zero.
+    """
+    points = {true_count: stats for (true_count, stats) in points.items()
+              if stats.count >= 2 and stats.std_error > 0}
+    if not any(stats.mean > 2 * stats.std_error for stats in points.values()):
+        return None
+    weights = {true_count: 1 / stats.std_error ** 2
+               for (true_count, stats) in points.items()}
+    total = sum(weights.values())
+    x_mean = sum(w * x for (x, w) in weights.items()) / total
+    y_mean = sum(w * points[x].mean for (x, w) in weights.items()) / total
+    sxx = sum(w * (x - x_mean) ** 2 for (x, w) in weights.items())
+    sxy = sum(w * (x - x_mean) * (points[x].mean - y_mean)
+              for (x, w) in weights.items())
+    if sxx == 0 or sxy == 0:
+        return None
+    slope = sxy / sxx
+    return (x_mean - y_mean / slope, slope > 0)
+
+
+def round_index(crossing: float, above: bool) -> int:
+    """
+    Whole true count index for a crossing, rounded away from the counts
+    where basic strategy is better.
+    """
+    return math.ceil(crossing) if above else math.floor(crossing)
+
+
+def find_indices(search: IndexSearch, names: List[str],
+                 true_counts: List[int], batches: int,
+                 refine_batches: int = 0, window: int = 2) -> Dict:
+    """
+    Index of each situation's best deviation, {name: (index, action,
+    above)}, or None where basic strategy is best at every count searched.
+
+    All situations are simulated at every true count first. Each index
+    found is then refined with refine_batches more batches at the counts
+    within window of it, and refitted from those counts alone. A
+    deviation above applies at the index or more, one below under it.
+    """
+    rules = get_rules(search.rules).compile()
+    strategy = get_strategy("basic")
+    cells = [(name, true_count) for name in names for true_count in true_counts
+             if search.reachable(name, true_count)]
+    coarse = search.gather(cells, batches)
+
+    def best(name: str, results: Dict, counts: List[int]) -> Optional[Tuple]:
+        basic = ACTION_NAMES[basic_action(search.situations[name], rules,
+                                          strategy)]
+        found = None
+        for action in results[(name, counts[0])]["diffs"]:
+            if action == basic:
+                continue
+            fit = fit_index({true_count: results[(name, true_count)]
+                             ["diffs"][action] for true_count in counts})
+            if fit is None or not counts[0] <= fit[0] <= counts[-1]:
+                continue
+            # the deviation that applies closest to a neutral count
+            if found is None or abs(fit[0]) < abs(found[0]):
+                found = fit + (action,)
+        return found
+
+    indices = {}
+    for name in names:
+        counts = [true_count for (cell_name, true_count) in cells
+                  if cell_name == name]
+        indices[name] = best(name, coarse, counts) if counts else None
+
+    if refine_batches > 0:
+        refine_cells = []
+        for (name, found) in indices.items():
+            if found is not None:
+                refine_cells.extend(
+                    (name, true_count) for true_count in true_counts
+                    if abs(true_count - found[0]) <= window and
+                    (name, true_count) in coarse)
+        refined = search.gather(refine_cells, batches + refine_batches)
+        for name in names:
+            counts = [true_count for (cell_name, true_count) in refine_cells
+                      if cell_name == name]
+            if len(counts) >= 2:
+                indices[name] = best(name, refined, counts) or indices[name]
+
+    return {name: (None if found is None else
+                   (round_index(found[0], found[1]),
+                    ACTION_NAMES.index(found[2]), found[1]))
+            for (name, found) in indices.items()}
+
+
+def insurance_index(true_counts: List[int], num_decks: int,
+                    depth: float) -> Optional[int]:
+    """Lowest true count where insurance breaks even, computed exactly."""
+    for true_count in true_counts:
+        try:
+            # rounded so an exact break even is not lost to float error
+            if round(insurance_ev(true_count, num_decks, depth), 12) >= 0:
+                return true_count
+        except ValueError:
+            continue
+    return None
+
+
+def situation_key(situation: Situation,
+                  rules: CompiledRules) -> Tuple[int, bool, bool, int]:
+    """IndexTable key of a situation."""
+    state = _situation_state(situation, rules)
+    upcard = situation[2]
+    return (rules.total[state], rules.soft[state],
+            situation[0] == situation[1],
+            11 if upcard == 1 else RANK_VALUES[upcard])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Find the true counts where deviating from basic "
+                    "strategy pays, as a Hi-Lo index table")
+    parser.add_argument("output", help="Index table file, updated in place")
+    parser.add_argument("--hands", nargs="+", default=None,
+                        help="Situations to search like 16v10, s18vA or "
+                             "10,10v6 (defaults to all)")
+    parser.add_argument("-nd", "--num_decks", type=int, default=6,
+                        help="Number of decks in shoe")
+    parser.add_argument("--rules", default="reference",
+                        choices=sorted(RULE_PRESETS), help="Rule set")
+    parser.add_argument("--depth", type=float, default=0.5,
+                        help="Fraction of the shoe dealt before each hand")
+    parser.add_argument("--min_count", type=int, default=-8,
+                        help="Lowest true count searched")
+    parser.add_argument("--max_count", type=int, default=8,
+                        help="Highest true count searched")
+    parser.add_argument("-b", "--batches", type=int, default=10,
+                        help="Batches per true count in the first pass")
+    parser.add_argument("--refine_batches", type=int, default=20,
+                        help="More batches at true counts near each index")
+    parser.add_argument("--samples", type=int, default=2000,
+                        help="Samples per batch")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for samples")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes (defaults to all cores)")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached batches")
+
+    args = vars(parser.parse_args())
+    search = IndexSearch(args["rules"], args["num_decks"], args["depth"],
+                         max(2, args["samples"]), args["seed"],
+                         ResultCache(args["cache_dir"]), args["processes"])
+    names = args["hands"] or list(search.situations)
+    unknown = [name for name in names if name not in search.situations]
+    if unknown or not 0 < args["depth"] < 1:
+        print(f"Unknown situations {unknown}" if unknown
+              else "Depth must be in (0, 1)")
+        exit(1)
+    true_counts = list(range(args["min_count"], args["max_count"] + 1))
+    indices = find_indices(search, names, true_counts,
+                           max(1, args["batches"]),
+                           max(0, args["refine_batches"]))
+
+    # searched situations replace their old entries, the rest are kept
+    table = (IndexTable.load(args["output"])
+             if os.path.exists(args["output"]) else IndexTable())
+    rules = get_rules(args["rules"]).compile()
+    strategy = get_strategy("basic")
+    for name in names:
+        situation = search.situations[name]
+        key = situation_key(situation, rules)
+        basic = ACTION_NAMES[basic_action(situation, rules, strategy)]
+        table.plays.pop(key, None)
+        if indices[name] is None:
+            print(f"{name}: {basic} at every count")
+            continue
+        (index, action, above) = indices[name]
+        table.plays[key] = indices[name]
+        print(f"{name}: {ACTION_NAMES[action]} "
+              f"{'at' if above else 'below'} {index:+d}"
+              f"{' or above' if above else ''}, otherwise {basic}")
+    table.insurance = insurance_index(true_counts, args["num_decks"],
+                                      args["depth"])
+    print(f"insurance: at {table.insurance:+d} or above"
+          if table.insurance is not None else "insurance: never")
+    table.save(args["output"])
+    print(f"{search.batches_simulated} batches simulated, the rest cached")
@@ -0,0 +1,452 @@
+import random
+import time
+from typing import Iterator, List, Sequence, Tuple
+
+import metrics
+from checkpoint import (KIND_TABLE, CheckpointError, Checkpointer, Reader,
+                        Writer)
+from gamepieces.card import Card
+from gamepieces.deck import NoMoreCardsError
+from gamepieces.shoe import Shoe
+from simulation.strategies import (HIT, STAND, DOUBLE, SPLIT, Strategy,
+                                   get_strategy)
+
+# bump whenever a change alters simulated results, invalidates cached results
+ENGINE_VERSION = "1"
+
+
+def hand_value(hand: List[Card]) -> Tuple[int, bool]:
+    """
+    Returns (best total, soft) for a hand.
+
+    Totals above 21 mean the hand is bust.
+    """
+    total = 0
+    has_ace = False
+    for card in hand:
+        rank = card.rank
+        if rank == 1:
+            has_ace = True
+            total += 1
+        elif rank >= 10:
+            total += 10
+        else:
+            total += rank
+    if has_ace and total <= 11:
+        return total + 10, True
+    return total, False
+
+
+def card_value(card: Card) -> int:
+    """Blackjack value of a card, with aces counted as 11."""
+    if card.rank == 1:
+        return 11
+    return min(10, card.rank)
+
+
+class SimulationStats:
+    """Aggregate results of simulated play, mergeable across tables."""
+
+    FIELDS = ("rounds", "hands", "wagered", "net", "wins", "pushes",
+              "losses", "blackjacks", "busts", "dealer_busts", "reshuffles",
+              "eliminated", "insurance_wagered", "insurance_net",
+              "side_bet_wagered", "side_bet_net")
+
+    def __init__(self, **values):
+        for field in SimulationStats.FIELDS:
+            setattr(self, field, values.get(field, 0))
+
+    @property
+    def house_edge(self) -> float:
+        """House edge on main bets, as a fraction of the amount wagered."""
+        if self.wagered == 0:
+            return 0.0
+        return -self.net / self.wagered
+
+    def merge(self, other: "SimulationStats") -> None:
+        for field in SimulationStats.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in SimulationStats.FIELDS}
+
+    @staticmethod
+    def from_dict(values: dict) -> "SimulationStats":
+        return SimulationStats(**values)
+
+
+class Table:
+    """
+    Headless blackjack table played by bots.
+
+    Follows the same rules as BlackjackGame: dealer stands on 17, blackjack
+    pays 3:2, a single split, doubling on 9/10/11 and dealing until the shoe
+    runs out, at which point bets for the round are refunded.
+
+    side_bets, e.g. from sidebets.get_side_bet, are offered to every
+    player each round, and settled on the player's first two cards and
+    the dealer's.
+    """
+
+    def __init__(self, num_players: int, num_decks: int, min_bet: int,
+                 max_bet: int, starting_chips: int, strategy: Strategy,
+                 seed=None, shoes: Iterator[Shoe] = None,
+                 side_bets: Sequence = ()) -> None:
+        self.rng = random.Random(seed)
+        # shoes to deal in turn, e.g. ShoeLibrary.shoes(), instead of
+        # shuffling a new one at the start and whenever one runs out
+        self.shoes = shoes
+        self.shoe = self._new_shoe(num_decks)
+        self.num_decks = num_decks
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+        self.strategy = strategy
+        self.side_bets = list(side_bets)
+        self.chips = [starting_chips for _ in range(num_players)]
+        # parallel to chips, so callers can tell which players are left
+        self.player_ids = list(range(num_players))
+        # (player id, chips) of players who could no longer afford min_bet
+        self.eliminated_players = []
+        # (player id, hand) pairs and dealer hand of the last round played
+        self.last_hands = ([], [])
+        self.round = 1
+        self.stats = SimulationStats()
+
+    def play(self, num_rounds: int,
+             checkpointer: Checkpointer = None) -> SimulationStats:
+        """
+        Plays up to num_rounds rounds, stopping early if all players are out.
+
+        With a checkpointer, the table is saved every few seconds and once
+        more when done.
+        """
+        for _ in range(num_rounds):
+            if not self.play_round():
+                break
+            if checkpointer and checkpointer.due():
+                checkpointer.save(self.to_checkpoint())
+        if checkpointer:
+            checkpointer.save(self.to_checkpoint())
+        return self.stats
+
+    def to_checkpoint(self) -> bytes:
+        """
+        Full table state, including the shoe and RNG, between rounds.
+
+        Raises CheckpointError for a table dealing from shoes it was given,
+        as where it is in them can't be saved.
+        """
+        if self.shoes is not None:
+            raise CheckpointError("Tables dealing given shoes can't be "
+                                  "checkpointed")
+        writer = Writer(KIND_TABLE)
+        writer.int64(self.num_decks)
+        writer.int64(self.min_bet)
+        writer.int64(self.max_bet)
+        writer.text(self.strategy.name)
+        writer.int64(len(self.side_bets))
+        for side_bet in self.side_bets:
+            writer.text(side_bet.name)
+        writer.text(self._checkpoint_rules())
+        writer.int64(self.round)
+        writer.rng_state(self.rng.getstate())
+        writer.blob(self.shoe.to_codes())
+        for players in (list(zip(self.player_ids, self.chips)),
+                        self.eliminated_players):
+            writer.int64(len(players))
+            for (player_id, chips) in players:
+                writer.int64(player_id)
+                writer.number(chips)
+        for field in SimulationStats.FIELDS:
+            writer.number(getattr(self.stats, field))
+        return writer.getvalue()
+
+    def _checkpoint_rules(self) -> str:
+        """Rules saved with the table, empty for the game's own."""
+        return ""
+
+    @staticmethod
+    def from_checkpoint(data: bytes) -> "Table":
+        """Raises CheckpointError if data is not a table checkpoint."""
+        (table, rules) = Table._read_checkpoint(data)
+        if rules:
+            raise CheckpointError("Checkpoint is of a table with other "
+                                  "rules, resume it as a RuleTable")
+        return table
+
+    @staticmethod
+    def _read_checkpoint(data: bytes) -> Tuple["Table", str]:
+        """The table saved in data, and the rules saved with it."""
+        # side bets build on the engine, so are only imported when needed
+        from simulation.sidebets import get_side_bet
+
+        reader = Reader(data, KIND_TABLE)
+        (num_decks, min_bet, max_bet) = (reader.int64(), reader.int64(),
+                                         reader.int64())
+        strategy = get_strategy(reader.text())
+        side_bets = [get_side_bet(reader.text())
+                     for _ in range(reader.int64())]
+        table = Table(0, num_decks, min_bet, max_bet, 0, strategy,
+                      side_bets=side_bets)
+        rules = reader.text()
+        table.round = reader.int64()
+        table.rng.setstate(reader.rng_state())
+        table.shoe = Shoe.from_codes(num_decks, reader.blob(), rng=table.rng)
+        players = []
+        for _ in range(2):
+            num_players = reader.int64()
+            players.append([(reader.int64(), reader.number())
+                            for _ in range(num_players)])
+        (seated, eliminated) = players
+        table.player_ids = [player_id for (player_id, _) in seated]
+        table.chips = [chips for (_, chips) in seated]
+        table.eliminated_players = eliminated
+        for field in SimulationStats.FIELDS:
+            setattr(table.stats, field, reader.number())
+        return (table, rules)
+
+    def play_round(self) -> bool:
+        """Returns False if no players could afford to play the round."""
+        num_players = len(self.chips)
+        if min(self.chips, default=self.min_bet) < self.min_bet:
+            seated = []
+            for (player_id, c) in zip(self.player_ids, self.chips):
+                if c >= self.min_bet:
+                    seated.append((player_id, c))
+                else:
+                    self.eliminated_players.append((player_id, c))
+            self.player_ids = [player_id for (player_id, _) in seated]
+            self.chips = [c for (_, c) in seated]
+        self.stats.eliminated += num_players - len(self.chips)
+        metrics.incr(metrics.BUSTED_PLAYERS, num_players - len(self.chips))
+        if len(self.chips) == 0:
+            return False
+
+        chips_before = list(self.chips)
+        try:
+            self._play_hands()
+        except NoMoreCardsError:
+            # same as BlackjackGame: refund the round and reshuffle
+            self.chips = chips_before
+            self._reset_shoe()
+        self.round += 1
+        return True
+
+    def _new_shoe(self, num_decks: int) -> Shoe:
+        if self.shoes is not None:
+            return next(self.shoes)
+        return Shoe(num_decks, rng=self.rng)
+
+    def _reset_shoe(self):
+        self.shoe = self._new_shoe(self.num_decks)
+        self.stats.reshuffles += 1
+        metrics.incr(metrics.RESHUFFLES)
+
+    def _play_hands(self):
+        """Raises NoMoreCardsError if run out cards."""
+        strategy = self.strategy
+        chips = self.chips
+        deal = self.shoe.deal
+        num_players = len(chips)
+        strategy.observe(self.shoe)
+
+        bets = []
+        for i in range(num_players):
+            bet = strategy.bet(chips[i], self.min_bet, self.max_bet)
+            bet = max(self.min_bet, min(bet, self.max_bet, chips[i]))
+            chips[i] -= bet
+            bets.append(bet)
+        side_stakes = self._take_side_bets() if self.side_bets else None
+
+        hands = [[] for _ in range(num_players)]
+        for _ in range(2):
+            for hand in hands:
+                hand.append(deal())
+        dealer_hand = [deal(), deal()]
+        upcard = dealer_hand[0]
+
+        side_bets = [0] * num_players
+        if upcard.rank == 1:
+            for i in range(num_players):
+                side_bet = strategy.insurance(hands[i], bets[i], chips[i])
+                side_bet = max(0, min(side_bet, bets[i] // 2, chips[i]))
+                chips[i] -= side_bet
+                side_bets[i] = side_bet
+
+        dealer_blackjack = False
+        if upcard.rank == 1 or upcard.rank >= 10:
+            dealer_blackjack = hand_value(dealer_hand)[0] == 21
+
+        # each entry is (player index, hand, bet, blackjack)
+        settle = []
+        for i in range(num_players):
+            if dealer_blackjack:
+                blackjack = hand_value(hands[i])[0] == 21
+                settle.append((i, hands[i], bets[i], blackjack))
+            else:
+                for (hand, bet, blackjack) in self._play_player(
+                        i, hands[i], bets[i], card_value(upcard)):
+                    settle.append((i, hand, bet, blackjack))
+
+        dealer_total = 0
+        if not dealer_blackjack:
+            dealer_total = self._play_dealer(dealer_hand)
+
+        if side_stakes:
+            self._settle_side_bets(side_stakes, hands, dealer_hand)
+        self._settle(settle, side_bets, dealer_blackjack, dealer_total)
+        self.last_hands = ([(self.player_ids[i], hand)
+                            for (i, hand, _, _) in settle],
+                           dealer_hand)
+
+    def _take_side_bets(self) -> List[List[int]]:
+        """Each player's stake on each side bet, taken before the deal."""
+        strategy = self.strategy
+        chips = self.chips
+        stakes = []
+        for i in range(len(chips)):
+            player_stakes = []
+            for side_bet in self.side_bets:
+                stake = strategy.side_bet(side_bet, chips[i], self.min_bet)
+                stake = max(0, min(stake, chips[i]))
+                chips[i] -= stake
+                player_stakes.append(stake)
+            stakes.append(player_stakes)
+        return stakes
+
+    def _settle_side_bets(self, stakes, hands, dealer_hand):
+        """Looks each side bet up by the first two cards of every hand."""
+        chips = self.chips
+        stats = self.stats
+        (upcard, hole) = (dealer_hand[0].to_code(), dealer_hand[1].to_code())
+        for (i, hand) in enumerate(hands):
+            player = (hand[0].to_code(), hand[1].to_code())
+            for (side_bet, stake) in zip(self.side_bets, stakes[i]):
+                if stake == 0:
+                    continue
+                payout = side_bet.payout(player, upcard, hole)
+                if payout:
+                    # the stake comes back with the winnings
+                    chips[i] += stake * (payout + 1)
+                stats.side_bet_wagered += stake
+                stats.side_bet_net += stake * payout if payout else -stake
+
+    def _play_player(self, i, hand, bet, upcard):
+        """Returns list of (hand, bet, blackjack) to settle for player i."""
+        total, soft = hand_value(hand)
+        if total == 21:
+            return [(hand, bet, True)]
+
+        chips = self.chips
+        hard_total = total - 10 if soft else total
+        can_double = hard_total in (9, 10, 11) and chips[i] >= bet
+        can_split = hand[0].rank == hand[1].rank and chips[i] >= bet
+
+        action = self._decide(total, soft, upcard, can_double, can_split,
+                              hand)
+        if action == SPLIT and can_split:
+            chips[i] -= bet
+            results = []
+            for split_hand in ([hand[0]], [hand[1]]):
+                self._play_normal(split_hand, upcard)
+                blackjack = (len(split_hand) == 2 and
+                             hand_value(split_hand)[0] == 21)
+                results.append((split_hand, bet, blackjack))
+            return results
+        if action == DOUBLE and can_double:
+            chips[i] -= bet
+            hand.append(self.shoe.deal())
+            return [(hand, bet * 2, False)]
+
+        # a split or double that is not allowed falls back to normal play
+        if action != STAND:
+            if action == HIT:
+                hand.append(self.shoe.deal())
+            self._play_normal(hand, upcard)
+        return [(hand, bet, False)]
+
+    def _play_normal(self, hand, upcard):
+        """Hit or stand until the strategy stands or the hand busts."""
+        deal = self.shoe.deal
+        while True:
+            total, soft = hand_value(hand)
+            if total > 21:
+                return
+            if self._decide(total, soft, upcard, False, False, hand) != HIT:
+                return
+            hand.append(deal())
+
+    def _decide(self, total, soft, upcard, can_double, can_split, hand):
+        """strategy.action, timed only while metrics are enabled."""
+        if not metrics.enabled():
+            return self.strategy.action(total, soft, upcard, can_double,
+                                        can_split, hand)
+        start = time.perf_counter_ns()
+        action = self.strategy.action(total, soft, upcard, can_double,
+                                      can_split, hand)
+        metrics.incr(metrics.DECISIONS)
+        metrics.incr(metrics.DECISION_NS, time.perf_counter_ns() - start)
+        return action
+
+    def _play_dealer(self, dealer_hand) -> int:
+        total = hand_value(dealer_hand)[0]
+        while total < 17:
+            dealer_hand.append(self.shoe.deal())
+            total = hand_value(dealer_hand)[0]
+        return total
+
+    def _settle(self, settle, side_bets, dealer_blackjack, dealer_total):
+        chips = self.chips
+        stats = self.stats
+        stats.rounds += 1
+        metrics.incr(metrics.ROUNDS)
+        if dealer_total > 21:
+            stats.dealer_busts += 1
+
+        for (i, side_bet) in enumerate(side_bets):
+            if side_bet > 0:
+                stats.insurance_wagered += side_bet
+                if dealer_blackjack:
+                    chips[i] += side_bet * 2
+                    stats.insurance_net += side_bet
+                else:
+                    stats.insurance_net -= side_bet
+
+        for (i, hand, bet, blackjack) in settle:
+            multiple = payout_multiple(hand_value(hand)[0], blackjack,
+                                       dealer_blackjack, dealer_total)
+            chips[i] += bet * multiple
+
+            stats.hands += 1
+            stats.wagered += bet
+            stats.net += bet * (multiple - 1)
+            metrics.incr(metrics.HANDS)
+            metrics.incr(metrics.WAGERED, bet)
+            metrics.incr(metrics.HOUSE_NET, bet * (1 - multiple))
+            if blackjack:
+                stats.blackjacks += 1
+            if multiple > 1:
+                stats.wins += 1
+            elif multiple == 1:
+                stats.pushes += 1
+            else:
+                stats.losses += 1
+                if not dealer_blackjack and hand_value(hand)[0] > 21:
+                    stats.busts += 1
+                    metrics.incr(metrics.HAND_BUSTS)
+
+
+def payout_multiple(player_total: int, player_blackjack: bool,
+                    dealer_blackjack: bool, dealer_total: int) -> float:
+    """Multiple of the bet returned to the player, as in BlackjackGame."""
+    if dealer_blackjack:
+        return 1 if player_blackjack else 0
+    if player_blackjack:
+        return 2.5
+    if player_total > 21:
+        return 0
+    if dealer_total > 21 or player_total > dealer_total:
+        return 2
+    if player_total == dealer_total:
+        return 1
+    return 0
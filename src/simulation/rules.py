@@ -0,0 +1,423 @@
+import json
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import metrics
+from checkpoint import CheckpointError
+from gamepieces.shoe import Shoe
+from simulation.engine import Table
+from simulation.strategies import HIT, STAND, DOUBLE, SPLIT, Strategy
+
+# hands are tracked as a state, hard total * 2 plus 1 when holding an ace;
+# hard totals stop at 31, hitting a hard 21 with a ten
+MAX_HARD = 31
+NUM_STATES = (MAX_HARD + 1) * 2
+
+# blackjack value of each rank, aces counted as 1
+RANK_VALUES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+
+
+class RuleSet:
+    """
+    Table rules a simulation can vary. The defaults are BlackjackGame's.
+
+    double_totals are the hard totals a two card hand may double on, None
+    allows any. max_splits is the number of splits per player, above one
+    allows resplitting. penetration is the fraction of the shoe dealt
+    before reshuffling between rounds, None deals until the shoe runs out.
+    """
+
+    def __init__(self, hit_soft_17: bool = False,
+                 blackjack_pays: float = 1.5,
+                 double_totals: Optional[Tuple[int, ...]] = (9, 10, 11),
+                 double_after_split: bool = False, max_splits: int = 1,
+                 surrender: bool = False, split_blackjack: bool = True,
+                 penetration: Optional[float] = None) -> None:
+        if blackjack_pays <= 0:
+            raise ValueError("Blackjack must pay more than nothing")
+        if max_splits < 0:
+            raise ValueError("Number of splits can't be negative")
+        if penetration is not None and not 0 < penetration <= 1:
+            raise ValueError("Penetration must be in (0, 1]")
+        self.hit_soft_17 = hit_soft_17
+        self.blackjack_pays = blackjack_pays
+        self.double_totals = (None if double_totals is None
+                              else tuple(double_totals))
+        self.double_after_split = double_after_split
+        self.max_splits = max_splits
+        self.surrender = surrender
+        self.split_blackjack = split_blackjack
+        self.penetration = penetration
+        self._compiled = None
+
+    def to_dict(self) -> dict:
+        return {name: value for (name, value) in vars(self).items()
+                if not name.startswith("_")}
+
+    def compile(self) -> "CompiledRules":
+        """Lookup tables for these rules, built on first use."""
+        if self._compiled is None:
+            self._compiled = CompiledRules(self)
+        return self._compiled
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={value!r}"
+                           for (name, value) in self.to_dict().items())
+        return f"RuleSet({values})"
+
+
+class CompiledRules:
+    """
+    RuleSet folded into per-state tables, so playing a hand looks rules up
+    instead of testing them.
+    """
+
+    def __init__(self, rules: RuleSet) -> None:
+        self.rules = rules
+        # next_state[state][rank] is the state after drawing a card
+        self.next_state = []
+        self.total = []
+        self.soft = []
+        self.dealer_hits = []
+        self.can_double = []
+        self.can_double_split = []
+        for state in range(NUM_STATES):
+            (hard, ace) = divmod(state, 2)
+            self.next_state.append(
+                [min(MAX_HARD, hard + RANK_VALUES[rank]) * 2 +
+                 (ace or rank == 1) for rank in range(14)])
+            soft = bool(ace) and hard <= 11
+            total = hard + 10 if soft else hard
+            self.total.append(total)
+            self.soft.append(soft)
+            self.dealer_hits.append(
+                total < 17 or (rules.hit_soft_17 and total == 17 and soft))
+            double = (rules.double_totals is None or
+                      hard in rules.double_totals)
+            self.can_double.append(double)
+            self.can_double_split.append(double and rules.double_after_split)
+
+        # multiple of the bet returned for a blackjack, stake included
+        self.blackjack_multiple = 1 + rules.blackjack_pays
+        self.max_splits = rules.max_splits
+        self.split_blackjack = rules.split_blackjack
+
+    def hand_state(self, hand) -> int:
+        state = 0
+        for card in hand:
+            state = self.next_state[state][card.rank]
+        return state
+
+
+# named rule sets for sweeps and comparisons
+RULE_PRESETS: Dict[str, RuleSet] = {
+    "reference": RuleSet(),
+    "vegas_s17": RuleSet(double_totals=None, double_after_split=True,
+                         max_splits=3, surrender=True,
+                         split_blackjack=False, penetration=0.75),
+    "vegas_h17": RuleSet(hit_soft_17=True, double_totals=None,
+                         double_after_split=True, max_splits=3,
+                         surrender=True, split_blackjack=False,
+                         penetration=0.75),
+    "six_five": RuleSet(hit_soft_17=True, blackjack_pays=1.2,
+                        double_totals=(10, 11), max_splits=3,
+                        split_blackjack=False, penetration=0.75),
+}
+
+
+def get_rules(name: str) -> RuleSet:
+    """Raises ValueError for unknown rule set names."""
+    if name not in RULE_PRESETS:
+        raise ValueError(
+            f"Unknown rules \"{name}\", choose from {sorted(RULE_PRESETS)}")
+    return RULE_PRESETS[name]
+
+
+class RuleTable(Table):
+    """
+    Headless table playing any RuleSet.
+
+    Rules that are off cost nothing per hand: their tables say no, and the
+    surrender and penetration kernels are picked once when seated.
+    """
+
+    def __init__(self, num_players: int, num_decks: int, min_bet: int,
+                 max_bet: int, starting_chips: int, strategy: Strategy,
+                 seed=None, shoes: Iterator[Shoe] = None,
+                 rules: RuleSet = None, side_bets: Sequence = ()) -> None:
+        super().__init__(num_players, num_decks, min_bet, max_bet,
+                         starting_chips, strategy, seed, shoes, side_bets)
+        self.rules = rules if rules is not None else RuleSet()
+        self._rules = self.rules.compile()
+        if self.rules.surrender:
+            self._play_player = self._play_player_surrender
+        else:
+            self._play_player = self._play_player_main
+        # reshuffle between rounds once this few cards are left, -1 never
+        self._cut_cards = -1
+        if self.rules.penetration is not None:
+            num_cards = num_decks * 52
+            self._cut_cards = num_cards - round(num_cards *
+                                                self.rules.penetration)
+
+    def _checkpoint_rules(self):
+        return json.dumps(self.rules.to_dict(), sort_keys=True)
+
+    @staticmethod
+    def from_checkpoint(data: bytes, rules: RuleSet = None) -> "RuleTable":
+        """
+        Resumes the table with the rules saved in its checkpoint.
+
+        Raises CheckpointError if data is not a rule table checkpoint, or
+        rules are given and differ from the saved ones.
+        """
+        (saved, saved_rules) = Table._read_checkpoint(data)
+        if not saved_rules:
+            raise CheckpointError("Checkpoint is of a table without rules")
+        saved_rules = RuleSet(**json.loads(saved_rules))
+        if rules is None:
+            rules = saved_rules
+        elif rules.to_dict() != saved_rules.to_dict():
+            raise CheckpointError(
+                f"Checkpoint is of a table playing {saved_rules}")
+        table = RuleTable(0, saved.num_decks, saved.min_bet, saved.max_bet,
+                          0, saved.strategy, rules=rules,
+                          side_bets=saved.side_bets)
+        for name in ("rng", "shoe", "chips", "player_ids",
+                     "eliminated_players", "round", "stats"):
+            setattr(table, name, getattr(saved, name))
+        return table
+
+    def _play_hands(self):
+        """Raises NoMoreCardsError if run out cards."""
+        if self.shoe.num_cards <= self._cut_cards:
+            self._reset_shoe()
+
+        rules = self._rules
+        total = rules.total
+        strategy = self.strategy
+        chips = self.chips
+        deal = self.shoe.deal
+        num_players = len(chips)
+        strategy.observe(self.shoe)
+
+        bets = []
+        for i in range(num_players):
+            bet = strategy.bet(chips[i], self.min_bet, self.max_bet)
+            bet = max(self.min_bet, min(bet, self.max_bet, chips[i]))
+            chips[i] -= bet
+            bets.append(bet)
+        side_stakes = self._take_side_bets() if self.side_bets else None
+
+        hands = [[] for _ in range(num_players)]
+        for _ in range(2):
+            for hand in hands:
+                hand.append(deal())
+        dealer_hand = [deal(), deal()]
+        upcard_rank = dealer_hand[0].rank
+        upcard = 11 if upcard_rank == 1 else RANK_VALUES[upcard_rank]
+
+        side_bets = [0] * num_players
+        if upcard_rank == 1:
+            for i in range(num_players):
+                side_bet = strategy.insurance(hands[i], bets[i], chips[i])
+                side_bet = max(0, min(side_bet, bets[i] // 2, chips[i]))
+                chips[i] -= side_bet
+                side_bets[i] = side_bet
+
+        dealer_state = rules.hand_state(dealer_hand)
+        dealer_blackjack = total[dealer_state] == 21
+
+        # each entry is (player index, hand, bet, total, blackjack,
+        # surrendered)
+        settle = []
+        for i in range(num_players):
+            state = rules.hand_state(hands[i])
+            if dealer_blackjack:
+                settle.append((i, hands[i], bets[i], total[state],
+                               total[state] == 21, False))
+            else:
+                for result in self._play_player(i, hands[i], state, bets[i],
+                                                upcard):
+                    settle.append((i,) + result)
+
+        dealer_total = total[dealer_state]
+        if not dealer_blackjack:
+            dealer_total = self._play_dealer_state(dealer_hand, dealer_state)
+
+        if side_stakes:
+            self._settle_side_bets(side_stakes, hands, dealer_hand)
+        self._settle(settle, side_bets, dealer_blackjack, dealer_total)
+        self.last_hands = ([(self.player_ids[i], hand)
+                            for (i, hand, _, _, _, _) in settle],
+                           dealer_hand)
+
+    def _play_player_surrender(self, i, hand, state, bet, upcard):
+        total = self._rules.total[state]
+        if total != 21 and self.strategy.surrender(
+                total, self._rules.soft[state], upcard, hand):
+            return [(hand, bet, total, False, True)]
+        return self._play_player_main(i, hand, state, bet, upcard)
+
+    def _play_player_main(self, i, hand, state, bet, upcard):
+        """Returns list of (hand, bet, total, blackjack, surrendered)."""
+        rules = self._rules
+        total = rules.total[state]
+        if total == 21:
+            return [(hand, bet, total, True, False)]
+
+        chips = self.chips
+        can_double = rules.can_double[state] and chips[i] >= bet
+        can_split = (rules.max_splits > 0 and hand[0].rank == hand[1].rank
+                     and chips[i] >= bet)
+
+        action = self._decide(total, rules.soft[state], upcard, can_double,
+                              can_split, hand)
+        if action == SPLIT and can_split:
+            return self._play_splits(i, hand, bet, upcard)
+        if action == DOUBLE and can_double:
+            chips[i] -= bet
+            card = self.shoe.deal()
+            hand.append(card)
+            state = rules.next_state[state][card.rank]
+            return [(hand, bet * 2, rules.total[state], False, False)]
+
+        # a split or double that is not allowed falls back to normal play
+        if action != STAND:
+            if action == HIT:
+                card = self.shoe.deal()
+                hand.append(card)
+                state = rules.next_state[state][card.rank]
+            state = self._play_normal_state(hand, state, upcard)
+        return [(hand, bet, rules.total[state], False, False)]
+
+    def _play_normal_state(self, hand, state, upcard) -> int:
+        """Hit or stand until the strategy stands or the hand busts."""
+        rules = self._rules
+        deal = self.shoe.deal
+        while True:
+            total = rules.total[state]
+            if total > 21:
+                return state
+            if self._decide(total, rules.soft[state], upcard, False, False,
+                            hand) != HIT:
+                return state
+            card = deal()
+            hand.append(card)
+            state = rules.next_state[state][card.rank]
+
+    def _play_splits(self, i, hand, bet, upcard):
+        """
+        Plays a split pair. Each hand starts from one card and is hit by
+        the strategy, then may double or split again if the rules allow.
+        """
+        rules = self._rules
+        next_state = rules.next_state
+        chips = self.chips
+        deal = self.shoe.deal
+        chips[i] -= bet
+        splits_left = rules.max_splits - 1
+        pending = [[hand[0]], [hand[1]]]
+        results = []
+        while pending:
+            split_hand = pending.pop(0)
+            state = next_state[0][split_hand[0].rank]
+            hand_bet = bet
+            while True:
+                total = rules.total[state]
+                if total > 21:
+                    break
+                two_cards = len(split_hand) == 2
+                can_double = (two_cards and rules.can_double_split[state]
+                              and chips[i] >= bet)
+                can_split = (two_cards and splits_left > 0 and
+                             split_hand[0].rank == split_hand[1].rank and
+                             chips[i] >= bet)
+                action = self._decide(total, rules.soft[state], upcard,
+                                      can_double, can_split, split_hand)
+                if action == SPLIT and can_split:
+                    chips[i] -= bet
+                    splits_left -= 1
+                    pending.insert(0, [split_hand.pop()])
+                    state = next_state[0][split_hand[0].rank]
+                    continue
+                if action == DOUBLE and can_double:
+                    chips[i] -= bet
+                    hand_bet = bet * 2
+                    card = deal()
+                    split_hand.append(card)
+                    state = next_state[state][card.rank]
+                    break
+                if action != HIT:
+                    break
+                card = deal()
+                split_hand.append(card)
+                state = next_state[state][card.rank]
+            blackjack = (rules.split_blackjack and len(split_hand) == 2 and
+                         rules.total[state] == 21)
+            results.append((split_hand, hand_bet, rules.total[state],
+                            blackjack, False))
+        return results
+
+    def _play_dealer_state(self, dealer_hand, state) -> int:
+        rules = self._rules
+        dealer_hits = rules.dealer_hits
+        next_state = rules.next_state
+        deal = self.shoe.deal
+        while dealer_hits[state]:
+            card = deal()
+            dealer_hand.append(card)
+            state = next_state[state][card.rank]
+        return rules.total[state]
+
+    def _settle(self, settle, side_bets, dealer_blackjack, dealer_total):
+        chips = self.chips
+        stats = self.stats
+        blackjack_multiple = self._rules.blackjack_multiple
+        stats.rounds += 1
+        metrics.incr(metrics.ROUNDS)
+        if dealer_total > 21:
+            stats.dealer_busts += 1
+
+        for (i, side_bet) in enumerate(side_bets):
+            if side_bet > 0:
+                stats.insurance_wagered += side_bet
+                if dealer_blackjack:
+                    chips[i] += side_bet * 2
+                    stats.insurance_net += side_bet
+                else:
+                    stats.insurance_net -= side_bet
+
+        for (i, hand, bet, total, blackjack, surrendered) in settle:
+            if dealer_blackjack:
+                multiple = 1 if blackjack else 0
+            elif surrendered:
+                multiple = 0.5
+            elif blackjack:
+                multiple = blackjack_multiple
+            elif total > 21:
+                multiple = 0
+            elif dealer_total > 21 or total > dealer_total:
+                multiple = 2
+            elif total == dealer_total:
+                multiple = 1
+            else:
+                multiple = 0
+            chips[i] += bet * multiple
+
+            stats.hands += 1
+            stats.wagered += bet
+            stats.net += bet * (multiple - 1)
+            metrics.incr(metrics.HANDS)
+            metrics.incr(metrics.WAGERED, bet)
+            metrics.incr(metrics.HOUSE_NET, bet * (1 - multiple))
+            if blackjack:
+                stats.blackjacks += 1
+            if multiple > 1:
+                stats.wins += 1
+            elif multiple == 1:
+                stats.pushes += 1
+            else:
+                stats.losses += 1
+                if not dealer_blackjack and total > 21:
+                    stats.busts += 1
+                    metrics.incr(metrics.HAND_BUSTS)
@@ -0,0 +1,181 @@
+import argparse
+import statistics
+from multiprocessing import Pool, cpu_count
+from typing import Dict, List, Optional, Tuple
+
+from simulation.rules import RuleTable, get_rules
+from simulation.strategies import get_strategy
+from simulation.sweep import cell_key, session_seed
+from simulation.variance import parse_competitor
+
+
+class RunningStats:
+    """
+    Count, mean and sum of squared deviations of a stream of values.
+
+    Values are added one at a time with Welford's update, and accumulators
+    from separate batches or workers merge exactly with Chan's formula.
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0,
+                 m2: float = 0.0) -> None:
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: "RunningStats") -> None:
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return float("inf")
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std_error(self) -> float:
+        if self.count == 0:
+            return float("inf")
+        return (self.variance / self.count) ** 0.5
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        """Half width of the normal confidence interval for the mean."""
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        return z * self.std_error
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @staticmethod
+    def from_dict(values: dict) -> "RunningStats":
+        return RunningStats(**values)
+
+
+def play_session(task: Tuple[str, str, int, int, int]) -> dict:
+    """
+    Net result, in units of the minimum bet, of every round one player
+    finishes. Shoes are dealt through to the rules' penetration, and the
+    player bets up to its strategy's spread.
+    """
+    (strategy, rules, num_decks, rounds, seed) = task
+    strategy = get_strategy(strategy)
+    table = RuleTable(1, num_decks, 1, strategy.spread, 10 ** 9, strategy,
+                      seed=seed, rules=get_rules(rules))
+    results = RunningStats()
+    stats = table.stats
+    for _ in range(rounds):
+        (net, played) = (stats.net, stats.rounds)
+        table.play_round()
+        # rounds cut short by an empty shoe are refunded, not results
+        if stats.rounds > played:
+            results.add(stats.net - net)
+    return results.to_dict()
+
+
+def run_adaptive(competitors: List[Tuple[str, str]], num_decks: int,
+                 target: float, confidence: float = 0.95,
+                 session_rounds: int = 10000, max_rounds: int = 10 ** 8,
+                 seed: int = 0, processes: Optional[int] = None,
+                 wave_sessions: Optional[int] = None) -> Dict:
+    """
+    Simulates each (strategy, rules) competitor until the confidence
+    interval of its net result per round is within +/- target, or it has
+    played max_rounds.
+
+    Sessions are played in waves across the pool and merged into one
+    accumulator per competitor. After each wave, competitors that have
+    met the target or the cap stop, and the rest get another wave.
+    Returns {competitor: (RunningStats, met target)}.
+    """
+    if wave_sessions is None:
+        wave_sessions = processes or cpu_count()
+    keys = {competitor: cell_key({"strategy": competitor[0],
+                                  "rules": competitor[1],
+                                  "num_decks": num_decks}, seed)
+            for competitor in competitors}
+    totals = {competitor: RunningStats() for competitor in competitors}
+    sessions = {competitor: 0 for competitor in competitors}
+    done = {}
+
+    with Pool(processes) as pool:
+        while len(done) < len(competitors):
+            tasks = []
+            owners = []
+            for competitor in competitors:
+                if competitor in done:
+                    continue
+                for _ in range(wave_sessions):
+                    rounds = min(session_rounds, max_rounds -
+                                 sessions[competitor] * session_rounds)
+                    if rounds <= 0:
+                        break
+                    tasks.append(competitor + (num_decks, rounds,
+                                 session_seed(keys[competitor],
+                                              sessions[competitor])))
+                    owners.append(competitor)
+                    sessions[competitor] += 1
+
+            results = pool.map(play_session, tasks)
+            for (competitor, result) in zip(owners, results):
+                totals[competitor].merge(RunningStats.from_dict(result))
+
+            for competitor in competitors:
+                if competitor in done:
+                    continue
+                if totals[competitor].half_width(confidence) <= target:
+                    done[competitor] = True
+                elif sessions[competitor] * session_rounds >= max_rounds:
+                    done[competitor] = False
+
+    return {competitor: (totals[competitor], done[competitor])
+            for competitor in competitors}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Simulate until the result per round is known to a "
+                    "target precision")
+    parser.add_argument("competitors", type=parse_competitor, nargs="+",
+                        help="strategy[:rules] to simulate")
+    parser.add_argument("-nd", "--num_decks", type=int, default=6,
+                        help="Number of decks in shoe")
+    parser.add_argument("-t", "--target", type=float, default=0.1,
+                        help="Confidence interval half width, in percent")
+    parser.add_argument("-c", "--confidence", type=float, default=0.95,
+                        help="Confidence level of the interval")
+    parser.add_argument("--session_rounds", type=int, default=10000,
+                        help="Rounds per session")
+    parser.add_argument("--max_rounds", type=int, default=10 ** 8,
+                        help="Most rounds played per competitor")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for sessions")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes (defaults to all cores)")
+
+    args = vars(parser.parse_args())
+    if not 0 < args["confidence"] < 1 or args["target"] <= 0:
+        print("Confidence must be in (0, 1) and target above 0")
+        exit(1)
+    results = run_adaptive(args["competitors"], args["num_decks"],
+                           args["target"] / 100, args["confidence"],
+                           max(1, args["session_rounds"]),
+                           max(1, args["max_rounds"]), args["seed"],
+                           args["processes"])
+    for ((strategy, rules), (stats, met)) in results.items():
+        print(f"{strategy}:{rules}: {stats.mean * 100:+.4f}% per round "
+              f"+/- {stats.half_width(args['confidence']) * 100:.4f}% "
+              f"after {stats.count} rounds"
+              f"{'' if met else ' (hit max_rounds)'}")
@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import operator
+import random
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from gamepieces.card import Card
+from simulation.engine import hand_value
+
+# every side bet here is settled on the first four cards of a round, dealt
+# to one player: player card, player card, dealer upcard, dealer hole card
+
+# index arithmetic for batches, TIMES_52[i] == i * 52
+TIMES_52 = [i * 52 for i in range(52 * 52)]
+
+RED_SUITS = (1, 2)
+
+# cards are never modified, so tables can share one card per code
+CARDS = [Card.from_code(code) for code in range(52)]
+
+
+def composition(codes: bytes) -> List[int]:
+    """Number of each card code left, e.g. from Shoe.to_codes()."""
+    return [codes.count(code) for code in range(52)]
+
+
+def _draws(counts: List[int], k: int, prefix: Tuple[int, ...] = (),
+           probability: float = 1.0) -> Iterator[Tuple[float, Tuple]]:
+    """(probability, codes) of every ordered draw of k cards from counts."""
+    if len(prefix) == k:
+        yield (probability, prefix)
+        return
+    remaining = sum(counts)
+    for code in range(52):
+        count = counts[code]
+        if count:
+            counts[code] -= 1
+            yield from _draws(counts, k, prefix + (code,),
+                              probability * count / remaining)
+            counts[code] += 1
+
+
+class SideBet:
+    """
+    Side bet settled from the first cards of a round.
+
+    pays() holds the bet's rules and is only called to build the payout
+    table, indexed by the card codes the bet looks at. Settling a hand,
+    exact EV and batches are all lookups in that table.
+    """
+
+    name = "base"
+    # how many of player card, player card, upcard the bet looks at
+    num_cards = 2
+
+    def __init__(self) -> None:
+        self.table = array("H", (self.pays(codes)
+                                 for codes in self._table_codes()))
+        # net result of a unit bet, the stake is lost on a 0 payout
+        self.net = array("d", (payout or -1 for payout in self.table))
+
+    def _table_codes(self) -> Iterator[Tuple]:
+        """What each table entry is for, in index order."""
+        return itertools.product(range(52), repeat=self.num_cards)
+
+    def pays(self, codes: Tuple[int, ...]) -> int:
+        """Payout to one for the cards, 0 if the bet loses."""
+        raise NotImplementedError
+
+    def index(self, player: Tuple[int, int], upcard: int, hole: int) -> int:
+        index = player[0] * 52 + player[1]
+        if self.num_cards == 3:
+            index = index * 52 + upcard
+        return index
+
+    def payout(self, player: Tuple[int, int], upcard: int,
+               hole: int) -> int:
+        return self.table[self.index(player, upcard, hole)]
+
+    def exact_ev(self, counts: List[int]) -> float:
+        """Expected net result of a unit bet dealt from counts."""
+        net = self.net
+        ev = 0.0
+        for (probability, codes) in _draws(list(counts), self.num_cards):
+            index = 0
+            for code in codes:
+                index = index * 52 + code
+            ev += probability * net[index]
+        return ev
+
+    def _indices(self, first, second, upcards, holes) -> Iterator[int]:
+        indices = map(operator.add, map(TIMES_52.__getitem__, first),
+                      second)
+        if self.num_cards == 3:
+            indices = map(operator.add, map(TIMES_52.__getitem__, indices),
+                          upcards)
+        return indices
+
+    def batch(self, shoes: Iterable[bytes]) -> Tuple[float, int]:
+        """
+        Total net result and number of unit bets settled over shoes of card
+        codes, each dealt out as consecutive four card rounds.
+
+        Cards are picked out of each shoe with strided slices and settled
+        with map over the tables, so there is no Python loop per round.
+        """
+        total = 0.0
+        rounds = 0
+        for codes in shoes:
+            end = len(codes) // 4 * 4
+            (first, second, upcards, holes) = (codes[i:end:4]
+                                               for i in range(4))
+            total += sum(map(self.net.__getitem__,
+                             self._indices(first, second, upcards, holes)))
+            rounds += end // 4
+        return (total, rounds)
+
+
+class PerfectPairs(SideBet):
+    """Player's two cards pair: mixed colours 6:1, colour 12:1, exact 25:1."""
+
+    name = "perfect_pairs"
+
+    def pays(self, codes):
+        (first, second) = (CARDS[code] for code in codes)
+        if first.rank != second.rank:
+            return 0
+        if first.suit == second.suit:
+            return 25
+        if (first.suit in RED_SUITS) == (second.suit in RED_SUITS):
+            return 12
+        return 6
+
+
+class TwentyOnePlusThree(SideBet):
+    """
+    Player's two cards and the upcard as a three card poker hand: suited
+    trips 100:1, straight flush 40:1, trips 30:1, straight 10:1, flush 5:1.
+    """
+
+    name = "21+3"
+    num_cards = 3
+
+    def pays(self, codes):
+        cards = [CARDS[code] for code in codes]
+        ranks = sorted(card.rank for card in cards)
+        flush = len(set(card.suit for card in cards)) == 1
+        trips = ranks[0] == ranks[2]
+        # aces play high or low
+        straight = (ranks == [ranks[0], ranks[0] + 1, ranks[0] + 2] or
+                    ranks == [1, 12, 13])
+        if trips and flush:
+            return 100
+        if straight and flush:
+            return 40
+        if trips:
+            return 30
+        if straight:
+            return 10
+        if flush:
+            return 5
+        return 0
+
+
+class LuckyLadies(SideBet):
+    """
+    Player's two cards total 20: queen of hearts pair with a dealer
+    blackjack 1000:1, queen of hearts pair 200:1, matched 25:1, suited
+    10:1, any 20 4:1.
+
+    The table is indexed by the player's cards and whether the dealer has
+    blackjack, which comes from a second table of dealer hands.
+    """
+
+    name = "lucky_ladies"
+    QUEEN_OF_HEARTS = (12 - 1) * 4 + 2
+
+    def __init__(self) -> None:
+        self.dealer_blackjack = bytes(
+            hand_value([CARDS[up], CARDS[hole]])[0] == 21
+            for (up, hole) in itertools.product(range(52), repeat=2))
+        super().__init__()
+
+    def _table_codes(self):
+        return itertools.product(range(52), range(52), (False, True))
+
+    def pays(self, codes):
+        (first, second, dealer_blackjack) = codes
+        hand = [CARDS[first], CARDS[second]]
+        if hand_value(hand)[0] != 20:
+            return 0
+        if first == second == LuckyLadies.QUEEN_OF_HEARTS:
+            return 1000 if dealer_blackjack else 200
+        if first == second:
+            return 25
+        if hand[0].suit == hand[1].suit:
+            return 10
+        return 4
+
+    def index(self, player, upcard, hole):
+        return ((player[0] * 52 + player[1]) * 2 +
+                self.dealer_blackjack[upcard * 52 + hole])
+
+    def exact_ev(self, counts):
+        net = self.net
+        ev = 0.0
+        counts = list(counts)
+        # counts leave out the player's cards while each draw is yielded
+        for (probability, (first, second)) in _draws(counts, 2):
+            # dealer blackjack from what is left, ace and ten either way up
+            remaining = sum(counts)
+            aces = sum(counts[0:4])
+            tens = sum(counts[36:52])
+            blackjack = 2 * aces * tens / (remaining * (remaining - 1))
+            index = (first * 52 + second) * 2
+            ev += probability * (blackjack * net[index + 1] +
+                                 (1 - blackjack) * net[index])
+        return ev
+
+    def _indices(self, first, second, upcards, holes):
+        players = map(operator.add, map(TIMES_52.__getitem__, first), second)
+        dealers = map(self.dealer_blackjack.__getitem__,
+                      map(operator.add, map(TIMES_52.__getitem__, upcards),
+                          holes))
+        return map(operator.add, map((2).__mul__, players), dealers)
+
+
+SIDE_BETS: Dict[str, type] = {
+    side_bet.name: side_bet
+    for side_bet in (LuckyLadies, PerfectPairs, TwentyOnePlusThree)
+}
+
+
+def get_side_bet(name: str) -> SideBet:
+    """Raises ValueError for unknown side bet names."""
+    if name not in SIDE_BETS:
+        raise ValueError(
+            f"Unknown side bet \"{name}\", choose from {sorted(SIDE_BETS)}")
+    return SIDE_BETS[name]()
+
+
+def random_shoes(num_decks: int, seed: int = 0) -> Iterator[bytes]:
+    rng = random.Random(seed)
+    codes = list(range(52)) * num_decks
+    while True:
+        rng.shuffle(codes)
+        yield bytes(codes)
+
+
+if __name__ == "__main__":
+    from gamepieces.shoe_library import ShoeLibrary
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Exact and simulated results of side bets")
+    parser.add_argument("-b", "--bets", nargs="+", default=sorted(SIDE_BETS),
+                        choices=sorted(SIDE_BETS), help="Side bets")
+    parser.add_argument("-nd", "--num_decks", type=int, default=6,
+                        help="Number of decks in shoe")
+    parser.add_argument("-n", "--shoes", type=int, default=1000,
+                        help="Shoes to simulate, 0 for exact results only")
+    parser.add_argument("--library", default=None,
+                        help="Deal shoes from this shoe library instead")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for shuffling")
+
+    args = vars(parser.parse_args())
+    library = None
+    if args["library"]:
+        library = ShoeLibrary(args["library"])
+        args["num_decks"] = library.num_decks
+    for name in args["bets"]:
+        side_bet = get_side_bet(name)
+        ev = side_bet.exact_ev([args["num_decks"]] * 52)
+        line = f"{name}: exact {ev * 100:+.4f}%"
+        if args["shoes"] > 0:
+            if library is not None:
+                shoes = (library.codes(row % len(library))
+                         for row in range(args["shoes"]))
+            else:
+                shoes = itertools.islice(
+                    random_shoes(args["num_decks"], args["seed"]),
+                    args["shoes"])
+            (total, rounds) = side_bet.batch(shoes)
+            line += f", simulated {total / rounds * 100:+.4f}% over {rounds}"
+        print(line)
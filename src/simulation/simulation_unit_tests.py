@@ -0,0 +1,600 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import unittest
+
+import metrics
+from checkpoint import CheckpointError
+from gamepieces.card import Card
+from gamepieces.shoe import Shoe
+from gamepieces.shoe_library import ShoeLibrary, ShoeLibraryError, generate
+from simulation.deviations import (IndexSearch, _Stream, composition_at,
+                                   evaluate_batch, fit_index, insurance_index,
+                                   play_action, round_index)
+from simulation.engine import Table, hand_value
+from simulation.rules import RuleSet, RuleTable, get_rules
+from simulation.sequential import RunningStats, play_session, run_adaptive
+from simulation.sidebets import (LuckyLadies, PerfectPairs, TwentyOnePlusThree,
+                                 composition)
+from simulation.strategies import (DOUBLE, HILO_VALUES, HIT,
+                                   ILLUSTRIOUS_18, SPLIT, STAND, IndexTable,
+                                   Strategy, get_strategy, parse_strategy)
+from simulation.sweep import ResultCache, cell_key, expand_grid, run_sweep
+from simulation.tournament import (Leaderboard, play_table, run_tournament,
+                                   seat_tables)
+from simulation.variance import (StreamShoe, compare, control_ev,
+                                 counts_cards, play_block)
+
+
+class TestEngine(unittest.TestCase):
+    def test_hand_value(self):
+        self.assertEqual(hand_value([Card(1, 2)]), (11, True))
+        self.assertEqual(hand_value([Card(1, 2), Card(13, 1)]), (21, True))
+        self.assertEqual(hand_value([Card(1, 2), Card(1, 1)]), (12, True))
+        self.assertEqual(
+            hand_value([Card(1, 2), Card(9, 1), Card(5, 1)]), (15, False))
+        self.assertEqual(
+            hand_value([Card(13, 2), Card(12, 1), Card(2, 1)]), (22, False))
+
+    def test_seeded_tables_repeat(self):
+        results = [Table(2, 4, 2, 500, 500, get_strategy("basic"),
+                         seed=7).play(200).to_dict() for _ in range(2)]
+        self.assertEqual(results[0], results[1])
+        self.assertGreater(results[0]["hands"], 0)
+
+    def test_checkpoint_resumes_exactly(self):
+        uninterrupted = Table(3, 2, 2, 500, 500, get_strategy("basic"),
+                              seed=11).play(300).to_dict()
+
+        table = Table(3, 2, 2, 500, 500, get_strategy("basic"), seed=11)
+        table.play(120)
+        resumed = Table.from_checkpoint(table.to_checkpoint())
+        self.assertEqual(resumed.play(180).to_dict(), uninterrupted)
+
+    def test_corrupt_checkpoint(self):
+        data = bytearray(Table(1, 1, 2, 500, 500, get_strategy("basic"),
+                               seed=1).to_checkpoint())
+        data[20] ^= 1
+        with self.assertRaises(CheckpointError):
+            Table.from_checkpoint(bytes(data))
+
+    def test_metrics_match_stats(self):
+        block = metrics.Metrics(f"bj_test_{os.getpid()}", create=True,
+                                num_slots=2)
+        try:
+            metrics.enable(block.shm.name)
+            stats = Table(2, 1, 2, 500, 500, get_strategy("basic"),
+                          seed=3).play(100)
+            metrics.disable()
+            totals = block.totals()
+        finally:
+            metrics.disable()
+            block.close()
+        self.assertEqual(totals["hands"], stats.hands)
+        self.assertEqual(totals["reshuffles"], stats.reshuffles)
+        self.assertAlmostEqual(totals["house_net"], -stats.net)
+
+    def test_metrics_rows_are_claimed(self):
+        block = metrics.Metrics(f"bj_test_{os.getpid()}", create=True,
+                                num_slots=2)
+        try:
+            self.assertEqual([block.claim(), block.claim(), block.claim()],
+                             [0, 1, None])
+            # a full block warns and leaves this process's metrics off
+            with self.assertWarns(UserWarning):
+                metrics.enable(block.shm.name)
+            self.assertFalse(metrics.enabled())
+            block.release(1)
+            metrics.enable(block.shm.name)
+            self.assertTrue(metrics.enabled())
+            metrics.incr(metrics.HOUSE_NET, -1.5)
+            self.assertEqual(block.totals()["house_net"], -1.5)
+        finally:
+            metrics.disable()
+            block.close()
+
+        totals = {counter: 0.0 for counter in metrics.COUNTERS}
+        totals["house_net"] = -1.5
+        text = metrics.to_prometheus(totals, {})
+        self.assertIn("# TYPE blackjack_house_net gauge", text)
+        self.assertIn("blackjack_house_net -1.5\n", text)
+        self.assertNotIn("blackjack_house_net_total", text)
+
+
+class TestShoeLibrary(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "shoes.bin")
+        generate(self.path, 2, 50, seed=5, rows_per_write=16)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_rows_are_full_shoes(self):
+        with ShoeLibrary(self.path) as library:
+            self.assertEqual((len(library), library.num_decks), (50, 2))
+            rows = [library.codes(row) for row in range(len(library))]
+        for codes in rows:
+            self.assertEqual(sorted(codes), sorted(list(range(52)) * 2))
+        self.assertEqual(len(set(rows)), 50)
+
+    def test_shoe_deals_row_in_order(self):
+        with ShoeLibrary(self.path) as library:
+            codes = library.codes(7)
+            shoe = library.shoe(7)
+            dealt = [shoe.deal().to_code() for _ in range(10)]
+            self.assertEqual(dealt, list(codes[:10]))
+            # the same cards are left after rebuilding as a plain shoe
+            rebuilt = Shoe.from_codes(2, shoe.to_codes())
+            self.assertEqual(rebuilt.num_cards, shoe.num_cards)
+            self.assertEqual(rebuilt.deal().to_code(), shoe.deal().to_code())
+
+    def test_tables_replay_same_shoes(self):
+        with ShoeLibrary(self.path) as library:
+            results = [Table(2, 2, 2, 500, 500, get_strategy("basic"),
+                             seed=seed, shoes=library.shoes(3)).play(200)
+                       .to_dict() for seed in (1, 2)]
+        self.assertEqual(results[0], results[1])
+        self.assertGreater(results[0]["reshuffles"], 0)
+
+    def test_tables_dealing_given_shoes_refuse_checkpoints(self):
+        with ShoeLibrary(self.path) as library:
+            table = Table(1, 2, 2, 500, 500, get_strategy("basic"),
+                          shoes=library.shoes())
+            with self.assertRaises(CheckpointError):
+                table.to_checkpoint()
+
+    def test_truncated_library(self):
+        with open(self.path, "r+b") as f:
+            f.truncate(100)
+        with self.assertRaises(ShoeLibraryError):
+            ShoeLibrary(self.path)
+
+
+class SplitEverythingStrategy(Strategy):
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        if can_split:
+            return SPLIT
+        return HIT if total < 12 else STAND
+
+
+class TestRules(unittest.TestCase):
+    def test_default_rules_match_table(self):
+        for (strategy, seed) in (("basic", 4), ("mimic", 5)):
+            results = [table_class(3, 2, 2, 500, 500, get_strategy(strategy),
+                                   seed=seed).play(300).to_dict()
+                       for table_class in (Table, RuleTable)]
+            self.assertEqual(results[0], results[1])
+
+    def test_compiled_tables(self):
+        s17 = RuleSet().compile()
+        h17 = RuleSet(hit_soft_17=True, double_totals=None).compile()
+        soft_17 = s17.hand_state([Card(1, 0), Card(6, 0)])
+        hard_17 = s17.hand_state([Card(10, 0), Card(7, 0)])
+        self.assertEqual((s17.total[soft_17], s17.soft[soft_17]), (17, True))
+        self.assertFalse(s17.dealer_hits[soft_17])
+        self.assertTrue(h17.dealer_hits[soft_17])
+        self.assertFalse(h17.dealer_hits[hard_17])
+        self.assertFalse(s17.can_double[hard_17])
+        self.assertTrue(h17.can_double[hard_17])
+
+    def test_six_five_costs_blackjacks(self):
+        (three_two, six_five) = [
+            RuleTable(2, 4, 10, 10, 10 ** 6, get_strategy("basic"), seed=9,
+                      rules=RuleSet(blackjack_pays=pays)).play(500)
+            for pays in (1.5, 1.2)]
+        self.assertGreater(three_two.blackjacks, 0)
+        self.assertEqual(six_five.blackjacks, three_two.blackjacks)
+        # 3 less per paid blackjack, those against a dealer blackjack push
+        lost = round(three_two.net - six_five.net)
+        self.assertGreater(lost, 0)
+        self.assertLessEqual(lost, three_two.blackjacks * 3)
+        self.assertEqual(lost % 3, 0)
+
+    def test_resplit(self):
+        # player 8 8, dealer 10 7, then the split hands draw 8 10 8 9
+        codes = bytes(reversed([28, 29, 36, 24, 30, 37, 31, 32]))
+        hands = []
+        for max_splits in (1, 2):
+            table = RuleTable(1, 1, 10, 10, 100, SplitEverythingStrategy(),
+                              rules=RuleSet(max_splits=max_splits))
+            table.shoe = Shoe.from_codes(1, codes)
+            table.play_round()
+            hands.append([hand_value(hand)[0]
+                          for (_, hand) in table.last_hands[0]])
+        self.assertEqual(hands[0], [16, 18])
+        self.assertEqual(hands[1], [18, 16, 17])
+
+    def test_penetration_reshuffles_early(self):
+        (full, cut) = [
+            RuleTable(1, 1, 2, 2, 10 ** 6, get_strategy("basic"), seed=2,
+                      rules=RuleSet(penetration=penetration)).play(300)
+            for penetration in (None, 0.5)]
+        self.assertGreater(cut.reshuffles, full.reshuffles)
+
+    def test_checkpoint_keeps_rules(self):
+        rules = get_rules("six_five")
+        uninterrupted = RuleTable(2, 2, 2, 500, 500, get_strategy("basic"),
+                                  seed=6, rules=rules).play(200).to_dict()
+        table = RuleTable(2, 2, 2, 500, 500, get_strategy("basic"), seed=6,
+                          rules=rules)
+        table.play(80)
+        data = table.to_checkpoint()
+        resumed = RuleTable.from_checkpoint(data)
+        self.assertEqual(resumed.rules.to_dict(), rules.to_dict())
+        self.assertEqual(resumed.play(120).to_dict(), uninterrupted)
+
+        self.assertIs(RuleTable.from_checkpoint(data, rules).rules, rules)
+        for resume in (lambda: RuleTable.from_checkpoint(
+                           data, get_rules("vegas_s17")),
+                       lambda: Table.from_checkpoint(data)):
+            with self.assertRaises(CheckpointError):
+                resume()
+
+
+class TestVariance(unittest.TestCase):
+    def test_stream_shoes(self):
+        (shoe, twin) = [StreamShoe(2, 42, antithetic)
+                        for antithetic in (False, True)]
+        dealt = [shoe.deal().rank for _ in range(104)]
+        mirrored = [twin.deal().rank for _ in range(104)]
+        self.assertEqual(sorted(dealt), sorted(list(range(1, 14)) * 8))
+        self.assertEqual(mirrored, [11 - rank if 2 <= rank <= 9 else rank
+                                    for rank in dealt])
+
+    def test_common_shoes_reduce_variance(self):
+        report = compare([("basic", "reference"), ("basic", "vegas_s17")],
+                         1, 20, 50, seed=3, processes=1)
+        self.assertGreater(report["variance_reduction"], 3)
+        independent = compare([("basic", "reference"),
+                               ("basic", "vegas_s17")],
+                              1, 20, 50, seed=3, crn=False, processes=1)
+        self.assertAlmostEqual(independent["variance_reduction"], 1)
+
+    def test_control_variate(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            (ev, std_error) = control_ev("reference", 1, 2000, 0,
+                                         ResultCache(cache_dir), processes=1)
+        self.assertGreater(std_error, 0)
+
+        # basic strategy is the control, so it is left uncorrected
+        plain = compare([("basic", "reference")], 1, 10, 50, processes=1)
+        corrected = compare([("basic", "reference")], 1, 10, 50,
+                            control=[(ev, std_error)], processes=1)
+        self.assertEqual(corrected["estimate"], plain["estimate"])
+        self.assertEqual(corrected["std_error"], plain["std_error"])
+
+        # the control's own error widens the reported error
+        (exact, rough) = (compare([("mimic", "reference")], 1, 10, 50,
+                                  control=[(ev, error)], processes=1)
+                          for error in (0.0, 0.1))
+        self.assertEqual(exact["estimate"], rough["estimate"])
+        self.assertGreater(rough["std_error"], exact["std_error"])
+
+    def test_counting_bots_deal_shoes_through(self):
+        competitors = [("hilo", "vegas_s17"), ("basic", "vegas_s17")]
+        self.assertTrue(counts_cards(competitors))
+        self.assertFalse(counts_cards(competitors[1:]))
+        (through, fresh) = (play_block(("hilo", "vegas_s17", 1, 500, 3,
+                                        False, dealt_through))
+                            for dealt_through in (True, False))
+        self.assertNotEqual(through, fresh)
+
+
+class TestSequential(unittest.TestCase):
+    def test_merged_stats_match_one_pass(self):
+        values = [(i * 37 % 11) - 5.5 for i in range(100)]
+        whole = RunningStats()
+        for value in values:
+            whole.add(value)
+        merged = RunningStats()
+        for chunk in (values[:10], values[10:60], values[60:]):
+            part = RunningStats()
+            for value in chunk:
+                part.add(value)
+            merged.merge(part)
+        merged.merge(RunningStats())
+        self.assertEqual(merged.count, 100)
+        self.assertAlmostEqual(merged.mean, statistics.fmean(values))
+        self.assertAlmostEqual(merged.variance, statistics.variance(values))
+        self.assertAlmostEqual(whole.variance, statistics.variance(values))
+
+    def test_stops_at_target_or_cap(self):
+        results = run_adaptive([("basic", "reference"), ("mimic", "reference")],
+                               1, 0.05, session_rounds=200, max_rounds=4000,
+                               processes=1)
+        (stats, met) = results[("basic", "reference")]
+        self.assertTrue(met)
+        self.assertLessEqual(stats.half_width(), 0.05)
+        self.assertLess(stats.count, 4000)
+
+        [(stats, met)] = run_adaptive([("basic", "reference")], 1, 0.0001,
+                                      session_rounds=200, max_rounds=1000,
+                                      processes=1).values()
+        self.assertFalse(met)
+        self.assertLessEqual(stats.count, 1000)
+
+    def test_counting_bots_spread_bets(self):
+        (basic, hilo) = (RunningStats.from_dict(
+                             play_session((strategy, "vegas_s17", 1, 2000, 7)))
+                         for strategy in ("basic", "hilo"))
+        self.assertGreater(hilo.variance, 2 * basic.variance)
+
+
+def code(rank, suit):
+    return Card(rank, suit).to_code()
+
+
+class TestSideBets(unittest.TestCase):
+    def test_payout_tables(self):
+        pairs = PerfectPairs()
+        self.assertEqual(pairs.payout((code(5, 1), code(5, 1)), 0, 0), 25)
+        self.assertEqual(pairs.payout((code(5, 1), code(5, 2)), 0, 0), 12)
+        self.assertEqual(pairs.payout((code(5, 1), code(5, 3)), 0, 0), 6)
+        self.assertEqual(pairs.payout((code(5, 1), code(6, 1)), 0, 0), 0)
+
+        poker = TwentyOnePlusThree()
+        self.assertEqual(poker.payout((code(1, 0), code(13, 0)),
+                                      code(12, 0), 0), 40)
+        self.assertEqual(poker.payout((code(1, 0), code(13, 1)),
+                                      code(2, 0), 0), 0)
+        self.assertEqual(poker.payout((code(7, 2), code(7, 2)),
+                                      code(7, 2), 0), 100)
+
+        ladies = LuckyLadies()
+        queen = code(12, 2)
+        self.assertEqual(ladies.payout((queen, queen), code(1, 0),
+                                       code(10, 0)), 1000)
+        self.assertEqual(ladies.payout((queen, queen), code(9, 0),
+                                       code(10, 0)), 200)
+        self.assertEqual(ladies.payout((code(1, 0), code(9, 1)), 0, 0), 4)
+
+    def test_exact_ev(self):
+        # one deck: 3 of 51 second cards pair, 1 of them the same colour
+        self.assertAlmostEqual(PerfectPairs().exact_ev([1] * 52),
+                               (12 + 6 * 2 - 48) / 51)
+        # only the cards left count
+        counts = composition(bytes([code(5, 1), code(5, 1), code(5, 1)]))
+        self.assertAlmostEqual(PerfectPairs().exact_ev(counts), 25)
+
+    def test_batch_matches_single_hands(self):
+        shoe = Shoe(2, rng=random.Random(8)).to_codes()
+        for side_bet in (PerfectPairs(), LuckyLadies()):
+            expected = sum(side_bet.payout((shoe[i], shoe[i + 1]),
+                                           shoe[i + 2], shoe[i + 3]) or -1
+                           for i in range(0, 104, 4))
+            self.assertEqual(side_bet.batch([shoe]), (expected, 26))
+
+    def test_tables_settle_side_bets(self):
+        pairs = PerfectPairs()
+        for table_class in (Table, RuleTable):
+            table = table_class(1, 2, 2, 500, 10 ** 6, get_strategy("mimic"),
+                                seed=3, side_bets=[pairs])
+            expected = 0
+            for _ in range(300):
+                rounds = table.stats.rounds
+                table.play_round()
+                # rounds refunded for an empty shoe refund side bets too
+                if table.stats.rounds > rounds:
+                    ([(_, hand)], _) = table.last_hands
+                    payout = pairs.payout((hand[0].to_code(),
+                                           hand[1].to_code()), 0, 0)
+                    expected += 2 * payout if payout else -2
+            stats = table.stats
+            self.assertEqual(stats.side_bet_wagered, 2 * stats.rounds)
+            self.assertEqual(stats.side_bet_net, expected)
+            self.assertGreater(expected, -2 * stats.rounds)
+
+            resumed = table_class.from_checkpoint(table.to_checkpoint())
+            self.assertEqual([side_bet.name for side_bet in resumed.side_bets],
+                             ["perfect_pairs"])
+
+
+class TestDeviations(unittest.TestCase):
+    def test_composition_at_true_count(self):
+        for true_count in (-4, 0, 3):
+            counts = composition_at((10, 6, 10), true_count, 6, 0.5)
+            self.assertEqual(sum(counts), 156)
+            # everything dealt counts to minus what is left
+            left_count = sum(HILO_VALUES[rank] * counts[rank]
+                             for rank in range(1, 14))
+            self.assertEqual(-left_count / 3, true_count)
+        with self.assertRaises(ValueError):
+            composition_at((10, 6, 10), 40, 6, 0.5)
+        self.assertEqual(insurance_index(list(range(-8, 9)), 6, 0.5), 3)
+
+    def test_actions_dealt_same_cards(self):
+        result = evaluate_batch(((10, 6, 10), 0, "reference", 1, 0.5, 300,
+                                 5))
+        self.assertEqual(set(result["nets"]), {"hit", "stand"})
+        self.assertEqual(result["nets"]["hit"]["count"],
+                         result["nets"]["stand"]["count"])
+        # basic strategy hits, so its own difference is always zero
+        self.assertEqual(result["diffs"]["hit"]["m2"], 0)
+        self.assertAlmostEqual(result["diffs"]["stand"]["mean"],
+                               result["nets"]["stand"]["mean"] -
+                               result["nets"]["hit"]["mean"])
+
+    def test_fit_index(self):
+        points = {true_count: RunningStats(100, 0.01 * (true_count - 2), 1)
+                  for true_count in range(-4, 9)}
+        (index, above) = fit_index(points)
+        self.assertAlmostEqual(index, 2)
+        self.assertTrue(above)
+        flat = {true_count: RunningStats(100, -0.1, 1)
+                for true_count in range(-4, 9)}
+        self.assertIsNone(fit_index(flat))
+        # rounded away from the counts where basic strategy is better
+        self.assertEqual(round_index(-0.4, True), 0)
+        self.assertEqual(round_index(-0.4, False), -1)
+        self.assertEqual(round_index(2, False), 2)
+
+    def test_doubled_split_hand_is_not_blackjack(self):
+        class LastCard:
+            def random(self):
+                return 0.99999
+
+        rules = RuleSet(double_totals=None, double_after_split=True).compile()
+        # hole 7, 8+3 doubles to 21 on a ten, 8+10 stands, dealer busts
+        stream = _Stream([10, 10, 10, 3, 7], LastCard())
+        self.assertEqual(play_action(SPLIT, (8, 8, 6), stream, rules,
+                                     get_strategy("basic")), 3)
+
+    def test_more_batches_only_simulate_new_ones(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            search = IndexSearch(num_decks=1, samples=20,
+                                 cache=ResultCache(cache_dir), processes=1)
+            cells = [("16v10", 0), ("16v10", 2)]
+            first = search.gather(cells, 2)
+            self.assertEqual(search.batches_simulated, 4)
+            again = search.gather(cells, 2)
+            self.assertEqual(search.batches_simulated, 4)
+            self.assertEqual(again[("16v10", 0)]["nets"]["hit"].mean,
+                             first[("16v10", 0)]["nets"]["hit"].mean)
+            more = search.gather(cells[:1], 3)
+            self.assertEqual(search.batches_simulated, 5)
+            self.assertGreater(more[("16v10", 0)]["nets"]["hit"].count,
+                               first[("16v10", 0)]["nets"]["hit"].count)
+
+    def test_index_table_round_trip(self):
+        table = IndexTable({(16, False, False, 10): (0, STAND, True),
+                            (13, False, False, 2): (-1, HIT, False)}, 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "indices.json")
+            table.save(path)
+            loaded = IndexTable.load(path)
+        self.assertEqual(loaded.plays, table.plays)
+        self.assertEqual(loaded.insurance, 3)
+        self.assertEqual(loaded.deviation(16, False, False, 10, 0.5), STAND)
+        self.assertIsNone(loaded.deviation(16, False, False, 10, -0.5))
+        self.assertEqual(loaded.deviation(13, False, False, 2, -1.5), HIT)
+        self.assertIsNone(loaded.deviation(13, False, False, 2, -1))
+        self.assertIsNone(loaded.deviation(15, False, False, 10, 9))
+
+    def test_counting_strategy(self):
+        strategy = get_strategy("hilo")
+        # a shoe missing four tens has been dealt a count of -4
+        shoe = Shoe.from_codes(1, bytes(range(36)) + bytes(range(40, 52)))
+        strategy.observe(shoe)
+        self.assertEqual(strategy.running_count, -4)
+        self.assertEqual(strategy.bet(500, 2, 500), 2)
+        hand = [Card(10, 0), Card(6, 0)]
+        self.assertEqual(strategy.action(16, False, 10, False, False, hand),
+                         HIT)
+        # a shoe missing every low card bets up and stands on 16 v 10
+        shoe = Shoe.from_codes(1, bytes(range(4)) + bytes(range(24, 52)))
+        strategy.observe(shoe)
+        self.assertGreater(strategy.true_count(), 8)
+        self.assertEqual(strategy.bet(500, 2, 500), 16)
+        self.assertEqual(strategy.action(16, False, 10, False, False, hand),
+                         STAND)
+        self.assertEqual(strategy.action(11, False, 11, True, False,
+                                         [Card(9, 0), Card(2, 0)]), DOUBLE)
+        self.assertEqual(strategy.insurance(hand, 10, 500), 5)
+
+        table = RuleTable(2, 2, 2, 500, 10 ** 6, strategy, seed=4)
+        for _ in range(200):
+            table.play_round()
+        self.assertGreater(table.stats.wagered, 2 * table.stats.hands)
+
+    def test_counting_strategy_loads_saved_table(self):
+        table = IndexTable({(16, False, False, 10): (9, STAND, True)}, None)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "indices.json")
+            table.save(path)
+            name = f"hilo@{path}"
+            strategy = get_strategy(name)
+            self.assertEqual(strategy.name, name)
+            self.assertEqual(strategy.indices.plays, table.plays)
+            self.assertIsNone(strategy.indices.insurance)
+            self.assertEqual(parse_strategy(name), name)
+
+            # checkpoints restore the bot with the same table
+            resumed = Table.from_checkpoint(
+                Table(1, 1, 2, 500, 500, strategy, seed=1).to_checkpoint())
+            self.assertEqual(resumed.strategy.indices.plays, table.plays)
+
+            missing = os.path.join(directory, "missing")
+            for bad in (f"basic@{path}", f"hilo@{missing}"):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    parse_strategy(bad)
+
+
+class TestSweep(unittest.TestCase):
+    def test_expand_grid(self):
+        cells = expand_grid({"num_decks": [1, 2], "strategy": ["basic"]})
+        self.assertEqual(cells, [{"num_decks": 1, "strategy": "basic"},
+                                 {"num_decks": 2, "strategy": "basic"}])
+
+    def test_cell_key(self):
+        self.assertEqual(cell_key({"a": 1, "b": 2}, 0),
+                         cell_key({"b": 2, "a": 1}, 0))
+        self.assertNotEqual(cell_key({"a": 1}, 0), cell_key({"a": 1}, 1))
+
+    def test_cell_key_addresses_index_tables_by_contents(self):
+        with tempfile.TemporaryDirectory() as directory:
+            (first, second) = (os.path.join(directory, name)
+                               for name in ("a.json", "b.json"))
+            ILLUSTRIOUS_18.save(first)
+            ILLUSTRIOUS_18.save(second)
+            keys = [cell_key({"strategy": f"hilo@{path}"}, 0)
+                    for path in (first, second)]
+            self.assertEqual(keys[0], keys[1])
+            # regenerated in place, the table gets a new key
+            IndexTable(insurance=3).save(first)
+            self.assertNotEqual(cell_key({"strategy": f"hilo@{first}"}, 0),
+                                keys[0])
+
+    def test_cached_cells_not_recomputed(self):
+        grid = {"num_decks": [1], "min_bet": [2], "max_bet": [500],
+                "starting_chips": [500], "num_players": [1],
+                "strategy": ["basic"]}
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResultCache(cache_dir)
+            first = run_sweep(grid, 50, 2, 0, cache, processes=1)
+            key = cell_key(first[0][0], 0)
+            entry = cache.get(key)
+            entry["stats"]["hands"] = -1
+            cache.put(key, entry)
+
+            grid["num_decks"].append(2)
+            second = run_sweep(grid, 50, 2, 0, cache, processes=1)
+            self.assertEqual(second[0][1].hands, -1)
+            self.assertGreater(second[1][1].hands, 0)
+
+
+class TestTournament(unittest.TestCase):
+    def test_seat_tables(self):
+        tables = seat_tables(list(range(15)), 7)
+        self.assertEqual([len(t) for t in tables], [5, 5, 5])
+        self.assertEqual(sorted(sum(tables, [])), list(range(15)))
+
+    def test_leaderboard(self):
+        leaderboard = Leaderboard(4, 100)
+        leaderboard.record(0, {0: 150, 1: 0, 2: 1, 3: 90}, 2)
+        leaderboard.record(1, {0: 120, 3: 1}, 2)
+        self.assertEqual(leaderboard.alive(), [0])
+        self.assertEqual(leaderboard.standings(), [0, 3, 2, 1])
+
+    def test_tournament_finishes(self):
+        config = {"num_decks": 1, "min_bet": 10, "max_bet": 500,
+                  "starting_chips": 100, "seats": 5, "min_seated": 3,
+                  "strategy": "basic", "rounds_per_level": 10,
+                  "bet_growth": 2}
+        leaderboard = run_tournament(30, config, processes=1)
+        self.assertEqual(len(leaderboard.alive()), 1)
+
+    def test_short_table_stops_for_reseating(self):
+        config = {"num_decks": 1, "strategy": "basic"}
+        # only one of the three players can afford the minimum bet
+        task = ([0, 1, 2], [1000, 5, 5], config, 10, 10, 0, 20)
+        (final_chips, played) = play_table(task + (2,))
+        self.assertEqual(played, 1)
+        self.assertEqual(sorted(final_chips), [0, 1, 2])
+        self.assertEqual(play_table(task + (0,))[1], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from checkpoint import write_atomic
+from gamepieces.card import Card
+
+# player actions
+HIT = 0
+STAND = 1
+DOUBLE = 2
+SPLIT = 3
+ACTION_NAMES = ("hit", "stand", "double", "split")
+
+# Hi-Lo count of each rank, aces are rank 1
+HILO_VALUES = (0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1)
+# Hi-Lo count of each card code plus one, for bytes.translate
+HILO_CODES = bytes([HILO_VALUES[code // 4 + 1] + 1 for code in range(52)] +
+                   [0] * 204)
+
+
+class Strategy:
+    """Base class for bot decisions in simulated games."""
+
+    name = "base"
+    # most units of the minimum bet the bot bets in a round
+    spread = 1
+    # bots that read the shoe, so it must be dealt through, not fresh
+    counts = False
+
+    def observe(self, shoe) -> None:
+        """Called with the shoe before every round's bets are placed."""
+        pass
+
+    def bet(self, chips, min_bet: int, max_bet: int) -> int:
+        """Flat betting at the table minimum."""
+        return min_bet
+
+    def insurance(self, hand: List[Card], bet: int, chips) -> int:
+        """Amount of insurance to buy when the dealer shows an ace."""
+        return 0
+
+    def side_bet(self, side_bet, chips, min_bet: int) -> int:
+        """Amount staked on a side bet the table offers, before the deal."""
+        return min_bet
+
+    def action(self, total: int, soft: bool, upcard: int,
+               can_double: bool, can_split: bool, hand: List[Card]) -> int:
+        """
+        Returns one of HIT, STAND, DOUBLE or SPLIT.
+
+        upcard is the dealer's face-up card value, with aces counted as 11.
+        """
+        raise NotImplementedError
+
+    def surrender(self, total: int, soft: bool, upcard: int,
+                  hand: List[Card]) -> bool:
+        """Whether to give up half the bet, only asked where allowed."""
+        return False
+
+
+class DealerMimicStrategy(Strategy):
+    """Plays like the dealer: hit below 17, never double or split."""
+
+    name = "mimic"
+
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        return HIT if total < 17 else STAND
+
+
+class NeverBustStrategy(Strategy):
+    """Never hits a hand that could bust."""
+
+    name = "never_bust"
+
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        if soft:
+            return HIT if total < 18 else STAND
+        return HIT if total < 12 else STAND
+
+
+class BasicStrategy(Strategy):
+    """
+    Basic strategy for this game's rules.
+
+    Dealer stands on all 17s, doubling is only allowed on 9, 10 and 11 and
+    split hands cannot be doubled.
+    """
+
+    name = "basic"
+
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        if can_split:
+            pair_val = min(10, hand[0].rank)
+            if hand[0].rank == 1 or pair_val == 8:
+                return SPLIT
+            if pair_val == 9 and upcard not in (7, 10, 11):
+                return SPLIT
+            if pair_val == 7 and upcard <= 7:
+                return SPLIT
+            if pair_val == 6 and 3 <= upcard <= 6:
+                return SPLIT
+            if pair_val in (2, 3) and 4 <= upcard <= 7:
+                return SPLIT
+
+        if soft:
+            if total >= 19:
+                return STAND
+            if total == 18:
+                return STAND if upcard <= 8 else HIT
+            return HIT
+
+        if can_double:
+            if total == 11 and upcard != 11:
+                return DOUBLE
+            if total == 10 and upcard <= 9:
+                return DOUBLE
+            if total == 9 and 3 <= upcard <= 6:
+                return DOUBLE
+
+        if total >= 17:
+            return STAND
+        if total >= 13:
+            return STAND if upcard <= 6 else HIT
+        if total == 12:
+            return STAND if 4 <= upcard <= 6 else HIT
+        return HIT
+
+    def surrender(self, total, soft, upcard, hand):
+        # late surrender, keeping pairs of eights to split
+        if soft or hand[0].rank == hand[1].rank == 8:
+            return False
+        return (total == 16 and upcard >= 9) or (total == 15 and upcard == 10)
+
+
+class IndexTable:
+    """
+    True count indices where play departs from basic strategy.
+
+    Plays are keyed by (total, soft, pair, upcard), where pair is True for
+    a two card hand that can be split, and map to (index, action, above).
+    The action is taken at a true count of index or more when above is
+    True, below index otherwise. insurance is the true count at or above
+    which insurance is bought, None never.
+    """
+
+    def __init__(self, plays: Dict[Tuple[int, bool, bool, int],
+                                   Tuple[int, int, bool]] = None,
+                 insurance: Optional[int] = None) -> None:
+        self.plays = dict(plays or {})
+        self.insurance = insurance
+
+    def deviation(self, total: int, soft: bool, pair: bool, upcard: int,
+                  true_count: float) -> Optional[int]:
+        """Action to take instead of basic strategy, None for basic."""
+        play = self.plays.get((total, soft, pair, upcard))
+        if play is None:
+            return None
+        (index, action, above) = play
+        if (true_count >= index) == above:
+            return action
+        return None
+
+    def to_dict(self) -> dict:
+        return {"insurance": self.insurance,
+                "plays": [[total, soft, pair, upcard, index,
+                           ACTION_NAMES[action], above]
+                          for ((total, soft, pair, upcard),
+                               (index, action, above))
+                          in sorted(self.plays.items())]}
+
+    @staticmethod
+    def from_dict(values: dict) -> "IndexTable":
+        return IndexTable(
+            {(total, soft, pair, upcard):
+             (index, ACTION_NAMES.index(action), above)
+             for (total, soft, pair, upcard, index, action, above)
+             in values["plays"]},
+            values["insurance"])
+
+    def digest(self) -> str:
+        """Hash of the table's contents, wherever it is saved."""
+        payload = json.dumps(self.to_dict(), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def save(self, path: str) -> None:
+        write_atomic(path, json.dumps(self.to_dict()).encode("utf-8"))
+
+    @staticmethod
+    def load(path: str) -> "IndexTable":
+        with open(path) as f:
+            return IndexTable.from_dict(json.load(f))
+
+
+def _plays(rows: Iterable[Tuple]) -> Dict:
+    return {(total, soft, pair, upcard): (index, action, above)
+            for (total, soft, pair, upcard, index, action, above) in rows}
+
+
+# published Hi-Lo indices for the 18 most valuable plays, insurance at +3
+ILLUSTRIOUS_18 = IndexTable(_plays((
+    (16, False, False, 10, 0, STAND, True),
+    (15, False, False, 10, 4, STAND, True),
+    (20, False, True, 5, 5, SPLIT, True),
+    (20, False, True, 6, 4, SPLIT, True),
+    (10, False, False, 10, 4, DOUBLE, True),
+    (12, False, False, 3, 2, STAND, True),
+    (12, False, False, 2, 3, STAND, True),
+    (11, False, False, 11, 1, DOUBLE, True),
+    (9, False, False, 2, 1, DOUBLE, True),
+    (10, False, False, 11, 4, DOUBLE, True),
+    (9, False, False, 7, 3, DOUBLE, True),
+    (16, False, False, 9, 5, STAND, True),
+    (13, False, False, 2, -1, HIT, False),
+    (12, False, False, 4, 0, HIT, False),
+    (12, False, False, 5, -2, HIT, False),
+    (12, False, False, 6, -1, HIT, False),
+    (13, False, False, 3, -2, HIT, False),
+)), insurance=3)
+
+
+def _hilo_upcard(upcard: int) -> int:
+    """Hi-Lo count of an upcard value, aces counted as 11."""
+    if upcard <= 6:
+        return 1
+    return -1 if upcard >= 10 else 0
+
+
+class CountingStrategy(BasicStrategy):
+    """
+    Hi-Lo card counter: basic strategy with deviations from an index
+    table, and a bet of one unit per true count above one.
+
+    The running count is taken from the shoe before each round, then
+    updated with the player's cards and the upcard for each decision.
+    """
+
+    name = "hilo"
+    counts = True
+
+    def __init__(self, indices: IndexTable = None, spread: int = 8) -> None:
+        self.indices = indices if indices is not None else ILLUSTRIOUS_18
+        self.spread = spread
+        self.running_count = 0
+        self.cards_left = 0
+
+    def observe(self, shoe):
+        codes = shoe.to_codes()
+        self.cards_left = len(codes)
+        # a full shoe counts to zero, so the cards seen count minus the rest
+        self.running_count = len(codes) - sum(codes.translate(HILO_CODES))
+
+    def true_count(self, seen: int = 0, count: int = 0) -> float:
+        """Count per deck left, after seen more cards counting count."""
+        decks_left = max(1, self.cards_left - seen) / 52
+        return (self.running_count + count) / decks_left
+
+    def _hand_count(self, hand: List[Card]) -> int:
+        return sum(HILO_VALUES[card.rank] for card in hand)
+
+    def bet(self, chips, min_bet, max_bet):
+        units = int(self.true_count()) - 1
+        return min_bet * max(1, min(self.spread, units))
+
+    def insurance(self, hand, bet, chips):
+        index = self.indices.insurance
+        if index is None:
+            return 0
+        true_count = self.true_count(len(hand) + 1,
+                                     self._hand_count(hand) - 1)
+        return bet // 2 if true_count >= index else 0
+
+    def action(self, total, soft, upcard, can_double, can_split, hand):
+        true_count = self.true_count(
+            len(hand) + 1, self._hand_count(hand) + _hilo_upcard(upcard))
+        action = self.indices.deviation(total, soft, can_split, upcard,
+                                        true_count)
+        if (action is None or (action == DOUBLE and not can_double) or
+                (action == SPLIT and not can_split)):
+            return super().action(total, soft, upcard, can_double,
+                                  can_split, hand)
+        return action
+
+
+STRATEGIES: Dict[str, type] = {
+    strategy.name: strategy
+    for strategy in (BasicStrategy, CountingStrategy, DealerMimicStrategy,
+                     NeverBustStrategy)
+}
+
+
+def get_strategy(name: str) -> Strategy:
+    """
+    Raises ValueError for unknown strategy names. hilo@path is the hilo bot
+    playing the index table saved at path, e.g. by deviations.py.
+    """
+    (base, _, indices) = name.partition("@")
+    if base not in STRATEGIES or (indices and base != CountingStrategy.name):
+        raise ValueError(
+            f"Unknown strategy \"{name}\", choose from {sorted(STRATEGIES)}"
+            f" or {CountingStrategy.name}@path")
+    if indices:
+        strategy = CountingStrategy(IndexTable.load(indices))
+        # named with its table, so checkpoints restore the same bot
+        strategy.name = name
+        return strategy
+    return STRATEGIES[base]()
+
+
+def strategy_key(name: str) -> str:
+    """
+    Strategy name as result caches address it. hilo@path becomes hilo with
+    the digest of the table at path, so a table regenerated in place is not
+    served results cached for the old one.
+    """
+    (base, _, indices) = name.partition("@")
+    if not indices:
+        return name
+    return f"{base}#{IndexTable.load(indices).digest()}"
+
+
+def parse_strategy(value: str) -> str:
+    """argparse type for strategy names, checking any index table loads."""
+    try:
+        get_strategy(value)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from checkpoint import Checkpointer, read_file
+from simulation.engine import ENGINE_VERSION, SimulationStats
+from simulation.rules import RULE_PRESETS, RuleTable, get_rules
+from simulation.strategies import get_strategy, parse_strategy, strategy_key
+
+# order of axes when printing results
+AXES = ("num_decks", "min_bet", "max_bet", "starting_chips", "num_players",
+        "strategy", "rules")
+
+DEFAULT_CACHE_DIR = ".sweep_cache"
+
+
+def expand_grid(grid: Dict[str, List]) -> List[Dict]:
+    """Expands {axis: [values]} into one config dict per grid cell."""
+    axes = sorted(grid)
+    return [dict(zip(axes, values))
+            for values in itertools.product(*(grid[axis] for axis in axes))]
+
+
+def cell_key(config: Dict, seed: int) -> str:
+    """
+    Content address of a cell: config, seed and engine version. A strategy
+    playing a saved index table is addressed by the table's contents.
+    """
+    if "strategy" in config:
+        config = dict(config, strategy=strategy_key(config["strategy"]))
+    payload = json.dumps({"config": config, "seed": seed,
+                          "engine_version": ENGINE_VERSION},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def session_seed(key: str, session: int) -> int:
+    """Deterministic per-session seed derived from the cell key."""
+    digest = hashlib.sha256(f"{key}:{session}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class ResultCache:
+    """On-disk cache of cell results, one JSON file per cell key."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, entry: dict) -> None:
+        """Written atomically so an interrupted sweep never leaves a bad entry."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def simulate_session(task: Tuple[Dict, int, Optional[str]]) -> dict:
+    """
+    Plays one table for a cell config, returns its stats as a dict.
+
+    With a checkpoint path, resumes from the checkpoint there if any.
+    """
+    (config, seed, checkpoint_path) = task
+    rules = get_rules(config.get("rules", "reference"))
+    checkpointer = None
+    table = None
+    if checkpoint_path:
+        checkpointer = Checkpointer(checkpoint_path)
+        if os.path.exists(checkpoint_path):
+            table = RuleTable.from_checkpoint(read_file(checkpoint_path),
+                                              rules)
+    if table is None:
+        table = RuleTable(config["num_players"], config["num_decks"],
+                          config["min_bet"], config["max_bet"],
+                          config["starting_chips"],
+                          get_strategy(config["strategy"]), seed=seed,
+                          rules=rules)
+    return table.play(config["rounds"] - (table.round - 1),
+                      checkpointer).to_dict()
+
+
+def _checkpoint_path(checkpoint_dir, key, session):
+    if checkpoint_dir is None:
+        return None
+    return os.path.join(checkpoint_dir, f"{key}-{session}.ckpt")
+
+
+def run_sweep(grid: Dict[str, List], rounds: int, sessions: int, seed: int,
+              cache: ResultCache, processes: Optional[int] = None,
+              metrics_name: Optional[str] = None,
+              checkpoint_dir: Optional[str] = None) -> List[Tuple[Dict, SimulationStats]]:
+    """
+    Simulates every cell of the grid that is not already cached.
+
+    Each cell is split into independently seeded sessions, which are
+    scheduled together across a process pool. Workers update the named
+    shared metrics block, if given. With a checkpoint_dir, sessions are
+    checkpointed there and an interrupted sweep picks up where it stopped.
+    """
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    cells = []
+    for config in expand_grid(grid):
+        config = dict(config, rounds=rounds, sessions=sessions)
+        cells.append((config, cell_key(config, seed)))
+
+    pending = [(config, key) for (config, key) in cells
+               if cache.get(key) is None]
+    tasks = [(config, session_seed(key, session),
+              _checkpoint_path(checkpoint_dir, key, session))
+             for (config, key) in pending
+             for session in range(sessions)]
+
+    if tasks:
+        initializer = metrics.enable if metrics_name else None
+        with Pool(processes, initializer, (metrics_name,)) as pool:
+            session_results = pool.map(simulate_session, tasks)
+        for (index, (config, key)) in enumerate(pending):
+            stats = SimulationStats()
+            for result in session_results[index * sessions:(index + 1) * sessions]:
+                stats.merge(SimulationStats.from_dict(result))
+            cache.put(key, {"config": config, "seed": seed,
+                            "engine_version": ENGINE_VERSION,
+                            "stats": stats.to_dict()})
+            for session in range(sessions):
+                path = _checkpoint_path(checkpoint_dir, key, session)
+                if path is not None:
+                    Checkpointer(path).remove()
+
+    return [(config, SimulationStats.from_dict(cache.get(key)["stats"]))
+            for (config, key) in cells]
+
+
+def _print_results(results):
+    header = list(AXES) + ["rounds", "hands", "house_edge", "eliminated"]
+    rows = [[str(config[axis]) for axis in AXES] +
+            [str(stats.rounds), str(stats.hands),
+             f"{stats.house_edge * 100:.3f}%", str(stats.eliminated)]
+            for (config, stats) in results]
+    widths = [max(len(row[i]) for row in rows + [header])
+              for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(col.rjust(width) for (col, width) in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Simulate every combination of the given values")
+    parser.add_argument("-np", "--num_players", type=int, nargs="+",
+                        default=[1], help="Number of players per table")
+    parser.add_argument("-nd", "--num_decks", type=int, nargs="+",
+                        default=[4], help="Number of decks in shoe")
+    parser.add_argument("-min", "--min_bet", type=int, nargs="+",
+                        default=[2], help="Minimum bet amount")
+    parser.add_argument("-max", "--max_bet", type=int, nargs="+",
+                        default=[500], help="Maximum bet amount")
+    parser.add_argument("-start", "--starting_chips", type=int, nargs="+",
+                        default=[500], help="Starting chips amount")
+    parser.add_argument("-s", "--strategy", nargs="+", default=["basic"],
+                        type=parse_strategy,
+                        help="Bot strategies to compare, hilo@path plays "
+                             "a saved index table")
+    parser.add_argument("--rules", nargs="+", default=["reference"],
+                        choices=sorted(RULE_PRESETS),
+                        help="Rule sets to compare")
+    parser.add_argument("-r", "--rounds", type=int, default=1000,
+                        help="Rounds per session")
+    parser.add_argument("-n", "--sessions", type=int, default=8,
+                        help="Independently seeded sessions per cell")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Sweep seed")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes (defaults to all cores)")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached cell results")
+    parser.add_argument("--metrics", default=None,
+                        help="Name of shared metrics block to update")
+    parser.add_argument("--checkpoint_dir", default=None,
+                        help="Checkpoint sessions here, resuming any found")
+
+    args = vars(parser.parse_args())
+    grid = {axis: args[axis] for axis in AXES}
+    results = run_sweep(grid, max(1, args["rounds"]),
+                        max(1, args["sessions"]), args["seed"],
+                        ResultCache(args["cache_dir"]), args["processes"],
+                        args["metrics"], args["checkpoint_dir"])
+    _print_results(results)
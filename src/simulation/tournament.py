@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import os
+import time
+from array import array
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from simulation.engine import Table
+from simulation.strategies import get_strategy, parse_strategy
+
+
+class Leaderboard:
+    """Standings for every entrant, kept in flat arrays indexed by entrant id."""
+
+    def __init__(self, num_entrants: int, starting_chips: int) -> None:
+        self.chips = array("d", [starting_chips]) * num_entrants
+        # level the entrant was knocked out in, -1 while still playing
+        self.eliminated_level = array("l", [-1]) * num_entrants
+
+    @property
+    def num_entrants(self) -> int:
+        return len(self.chips)
+
+    def alive(self) -> List[int]:
+        return [i for (i, level) in enumerate(self.eliminated_level)
+                if level < 0]
+
+    def record(self, level: int, final_chips: Dict[int, float],
+               min_bet: int) -> None:
+        """Updates chips after a level, knocking out anyone below min_bet."""
+        for (entrant, chips) in final_chips.items():
+            self.chips[entrant] = chips
+            if chips < min_bet:
+                self.eliminated_level[entrant] = level
+
+    def standings(self) -> List[int]:
+        """Entrant ids from first place to last."""
+        return sorted(range(self.num_entrants),
+                      key=lambda i: (self.eliminated_level[i] < 0,
+                                     self.eliminated_level[i],
+                                     self.chips[i]),
+                      reverse=True)
+
+
+def seat_tables(entrants: List[int], seats: int) -> List[List[int]]:
+    """Spreads entrants over as few tables as possible, with balanced sizes."""
+    num_tables = max(1, -(-len(entrants) // seats))
+    return [entrants[i::num_tables] for i in range(num_tables)]
+
+
+def _table_seed(seed: int, level: int, step: int, table: int) -> int:
+    digest = hashlib.sha256(
+        f"{seed}:{level}:{step}:{table}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def play_table(task: Tuple) -> Tuple[Dict[int, float], int]:
+    """
+    Plays one table for up to rounds rounds, returns every entrant's final
+    chips and the rounds played.
+
+    After each round the table stops early if fewer than min_seated players
+    can still afford the minimum bet, so they can be seated elsewhere.
+    """
+    (entrants, chips, config, min_bet, max_bet, seed, rounds,
+     min_seated) = task
+    table = Table(len(entrants), config["num_decks"], min_bet, max_bet, 0,
+                  get_strategy(config["strategy"]), seed=seed)
+    table.player_ids = list(entrants)
+    table.chips = list(chips)
+    played = 0
+    while played < rounds and table.play_round():
+        played += 1
+        if sum(c >= min_bet for c in table.chips) < min_seated:
+            break
+    final_chips = dict(table.eliminated_players)
+    final_chips.update(zip(table.player_ids, table.chips))
+    return (final_chips, played)
+
+
+def payouts(prize_pool: float, structure: List[float]) -> List[float]:
+    """Prize for each paid place, from percentages of the pool."""
+    total = sum(structure)
+    return [prize_pool * share / total for share in structure]
+
+
+def run_tournament(num_entrants: int, config: Dict, seed: int = 0,
+                   processes: Optional[int] = None,
+                   max_levels: int = 1000) -> Leaderboard:
+    """
+    Plays levels until one entrant is left or max_levels is reached.
+
+    Each level seats the survivors at balanced tables and plays every table
+    in parallel for config["rounds_per_level"] rounds. A table that drops
+    below config["min_seated"] players stops, and the survivors of all such
+    tables are reseated together at balanced tables, which play on for the
+    most rounds any of their old tables had left. Players below the minimum
+    bet are knocked out, and the bets rise by config["bet_growth"] after
+    each level.
+    """
+    leaderboard = Leaderboard(num_entrants, config["starting_chips"])
+    min_bet = config["min_bet"]
+    max_bet = config["max_bet"]
+    cores = processes or os.cpu_count()
+
+    with Pool(processes) as pool:
+        for level in range(max_levels):
+            alive = leaderboard.alive()
+            if len(alive) <= 1:
+                break
+
+            # (entrants, rounds left) of each table still playing the level
+            tables = [(entrants, config["rounds_per_level"])
+                      for entrants in seat_tables(alive, config["seats"])]
+            step = 0
+            while tables:
+                # a lone table has nowhere to send its players
+                min_seated = config["min_seated"] if len(tables) > 1 else 0
+                tasks = [(entrants, [leaderboard.chips[i] for i in entrants],
+                          config, min_bet, max_bet,
+                          _table_seed(seed, level, step, table_index),
+                          rounds, min_seated)
+                         for (table_index, (entrants, rounds))
+                         in enumerate(tables)]
+                chunksize = max(1, len(tasks) // (4 * cores))
+                results = pool.map(play_table, tasks, chunksize)
+
+                short = []
+                rounds_left = 0
+                for ((entrants, rounds), (final_chips, played)) in zip(
+                        tables, results):
+                    leaderboard.record(level, final_chips, min_bet)
+                    if played < rounds:
+                        short.extend(i for i in entrants
+                                     if leaderboard.eliminated_level[i] < 0)
+                        rounds_left = max(rounds_left, rounds - played)
+                tables = [(entrants, rounds_left)
+                          for entrants in seat_tables(short, config["seats"])
+                          if entrants]
+                step += 1
+
+            min_bet = int(min_bet * config["bet_growth"]) or 1
+            max_bet = max(max_bet, min_bet)
+    return leaderboard
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Run a multi-table elimination tournament of bots")
+    parser.add_argument("-e", "--entrants", type=int, default=10000,
+                        help="Number of bot entrants")
+    parser.add_argument("--seats", type=int, default=7,
+                        help="Maximum players per table")
+    parser.add_argument("-nd", "--num_decks", type=int, default=4,
+                        help="Number of decks in shoe")
+    parser.add_argument("-min", "--min_bet", type=int, default=10,
+                        help="Minimum bet amount at the first level")
+    parser.add_argument("-max", "--max_bet", type=int, default=500,
+                        help="Maximum bet amount")
+    parser.add_argument("-start", "--starting_chips", type=int, default=500,
+                        help="Starting chips amount")
+    parser.add_argument("-s", "--strategy", default="basic",
+                        type=parse_strategy,
+                        help="Bot strategy, hilo@path plays a saved index "
+                             "table")
+    parser.add_argument("--min_seated", type=int, default=3,
+                        help="Players a table drops below before its "
+                             "players are reseated")
+    parser.add_argument("-r", "--rounds_per_level", type=int, default=20,
+                        help="Rounds played per level")
+    parser.add_argument("-g", "--bet_growth", type=float, default=1.5,
+                        help="Minimum bet multiplier per level")
+    parser.add_argument("--buy_in", type=float, default=100,
+                        help="Buy in per entrant, for the prize pool")
+    parser.add_argument("--payout", type=float, nargs="+",
+                        default=[50, 30, 20], help="Percent of pool per place")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Tournament seed")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes (defaults to all cores)")
+
+    args = vars(parser.parse_args())
+    config = {key: args[key] for key in
+              ("num_decks", "min_bet", "max_bet", "starting_chips", "seats",
+               "min_seated", "strategy", "rounds_per_level", "bet_growth")}
+    config["seats"] = max(1, config["seats"])
+
+    start = time.perf_counter()
+    leaderboard = run_tournament(max(2, args["entrants"]), config,
+                                 args["seed"], args["processes"])
+    elapsed = time.perf_counter() - start
+
+    levels = max(leaderboard.eliminated_level) + 1
+    print(f"{leaderboard.num_entrants} entrants, {levels} levels "
+          f"in {elapsed:.2f}s")
+    prizes = payouts(args["buy_in"] * leaderboard.num_entrants,
+                     args["payout"])
+    for (place, entrant) in enumerate(leaderboard.standings()[:len(prizes)]):
+        level = leaderboard.eliminated_level[entrant]
+        status = (f"${leaderboard.chips[entrant]:.0f} chips" if level < 0
+                  else f"knocked out in level {level + 1}")
+        print(f"{place + 1}. Entrant {entrant} ({status}) "
+              f"wins ${prizes[place]:.2f}")
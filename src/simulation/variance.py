@@ -0,0 +1,299 @@
+import argparse
+import random
+import statistics
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from gamepieces.card import Card
+from gamepieces.deck import NoMoreCardsError
+from gamepieces.shoe import Shoe
+from simulation.engine import ENGINE_VERSION
+from simulation.rules import RULE_PRESETS, RuleTable, get_rules
+from simulation.strategies import get_strategy, parse_strategy
+from simulation.sweep import (DEFAULT_CACHE_DIR, ResultCache, cell_key,
+                              session_seed)
+
+# antithetic card for each card code: ranks 2-9 are mirrored, 2 <-> 9,
+# 3 <-> 8 and so on, so low cards become high ones with the same counts
+ANTITHETIC_CODES = bytes(
+    (9 - code // 4) * 4 + code % 4 if 1 <= code // 4 <= 8 else code
+    for code in range(52))
+IDENTITY_CODES = bytes(range(52))
+
+# strategy whose known result corrects the others as a control variate
+CONTROL_STRATEGY = "basic"
+
+# cards are never modified, so every shoe can deal the same 52 objects
+CARDS = [Card.from_code(code) for code in range(52)]
+
+
+class StreamShoe(Shoe):
+    """
+    Full shoe in a random order fixed by its seed, drawing each card as it
+    is dealt rather than shuffling every card up front.
+
+    The antithetic shoe deals the same order with ranks 2-9 mirrored.
+    """
+
+    def __init__(self, num_decks: int, seed: int,
+                 antithetic: bool = False) -> None:
+        # no cards list to build, so Shoe.__init__ is not called
+        self._num_decks = num_decks
+        self._rng = random.Random(seed)
+        self._codes = list(range(52)) * num_decks
+        self._mapping = ANTITHETIC_CODES if antithetic else IDENTITY_CODES
+
+    @property
+    def num_cards(self):
+        return len(self._codes)
+
+    def shuffle(self):
+        pass
+
+    def deal(self):
+        codes = self._codes
+        if not codes:
+            raise NoMoreCardsError()
+        metrics.incr(metrics.CARDS_DEALT)
+        # swap a random remaining card to the end and take it
+        i = int(self._rng.random() * len(codes))
+        (codes[i], codes[-1]) = (codes[-1], codes[i])
+        return CARDS[self._mapping[codes.pop()]]
+
+    def to_codes(self) -> bytes:
+        return bytes(self._mapping[code] for code in self._codes)
+
+
+def shoe_stream(seed: int, num_decks: int,
+                antithetic: bool = False) -> Iterator[Shoe]:
+    """Seeded shoes, the same sequence of shoes for the same seed."""
+    rng = random.Random(seed)
+    while True:
+        yield StreamShoe(num_decks, rng.getrandbits(64), antithetic)
+
+
+def play_block(task: Tuple[str, str, int, int, int, bool, bool]) -> float:
+    """
+    Net result per round of one player, in units of the minimum bet.
+
+    Every round is dealt from the next shoe of the stream, as from a
+    continuous shuffler, so competitors given the same stream start each
+    round from the same cards however their earlier rounds went. Dealt
+    through, each shoe is instead played down to the rules' penetration,
+    which card counters need to find a count to bet and play by.
+    """
+    (strategy, rules, num_decks, rounds, seed, antithetic,
+     dealt_through) = task
+    strategy = get_strategy(strategy)
+    shoes = shoe_stream(seed, num_decks, antithetic)
+    table = RuleTable(1, num_decks, 1, strategy.spread, 10 ** 9, strategy,
+                      shoes=shoes, rules=get_rules(rules))
+    for _ in range(rounds):
+        if not dealt_through:
+            table.shoe = next(shoes)
+        table.play_round()
+    stats = table.stats
+    return stats.net / stats.rounds if stats.rounds else 0.0
+
+
+def counts_cards(competitors: List[Tuple[str, str]]) -> bool:
+    """Whether any competitor counts cards, so every shoe is dealt through."""
+    return any(get_strategy(strategy).counts
+               for (strategy, _) in competitors)
+
+
+def control_ev(rules: str, num_decks: int, rounds: int, seed: int,
+               cache: ResultCache, processes: Optional[int] = None,
+               dealt_through: bool = False) -> Tuple[float, float]:
+    """
+    Basic strategy's net result per round under the rules, dealt as in
+    play_block, and the standard error of that estimate. Kept in the
+    result cache so it is only simulated once.
+
+    Blocks are seeded from the cache key rather than the seed itself, so
+    they never deal the shoes compare corrects with the same seed.
+    """
+    blocks = 100
+    config = {"control": CONTROL_STRATEGY, "rules": rules,
+              "num_decks": num_decks, "rounds": rounds,
+              "dealt_through": dealt_through}
+    key = cell_key(config, seed)
+    entry = cache.get(key)
+    if entry is None or "std_error" not in entry:
+        tasks = [(CONTROL_STRATEGY, rules, num_decks,
+                  max(1, rounds // blocks), session_seed(key, block), False,
+                  dealt_through)
+                 for block in range(blocks)]
+        with Pool(processes) as pool:
+            results = pool.map(play_block, tasks)
+        entry = {"config": config, "seed": seed,
+                 "engine_version": ENGINE_VERSION,
+                 "ev": statistics.fmean(results),
+                 "std_error": (statistics.variance(results) / blocks) ** 0.5}
+        cache.put(key, entry)
+    return (entry["ev"], entry["std_error"])
+
+
+def _pair_means(values: List[float]) -> List[float]:
+    return [(a + b) / 2 for (a, b) in zip(values[0::2], values[1::2])]
+
+
+def compare(competitors: List[Tuple[str, str]], num_decks: int, blocks: int,
+            rounds: int, seed: int = 0, crn: bool = True,
+            antithetic: bool = False,
+            control: Optional[List[Tuple[float, float]]] = None,
+            processes: Optional[int] = None) -> Dict:
+    """
+    Estimates the net result per round of one (strategy, rules) competitor,
+    or the difference between two, from blocks of rounds.
+
+    crn plays competitors on the same shoe streams, antithetic pairs each
+    stream with its rank-mirrored twin, and control, the (result per
+    round, standard error) of basic strategy under each competitor's
+    rules, corrects each block by basic strategy's own error on the same
+    shoes. The control's own error is part of the reported error, and
+    basic strategy competitors are not corrected, as they are the control.
+    Competitors are all dealt each shoe through when one of them counts
+    cards, and control must then be dealt the same way. The report
+    compares the estimate's variance with independent blocks costing as
+    many rounds.
+    """
+    rng = random.Random(seed)
+    seeds = [[rng.getrandbits(64) for _ in range(blocks)]
+             for _ in competitors]
+    if crn:
+        seeds = [seeds[0] for _ in competitors]
+    directions = (False, True) if antithetic else (False,)
+    dealt_through = counts_cards(competitors)
+    controlled = [control is not None and strategy != CONTROL_STRATEGY
+                  for (strategy, _) in competitors]
+
+    tasks = []
+    for (k, (strategy, rules)) in enumerate(competitors):
+        players = [strategy] + ([CONTROL_STRATEGY] if controlled[k] else [])
+        for player in players:
+            tasks.extend((player, rules, num_decks, rounds, block_seed,
+                          direction, dealt_through)
+                         for block_seed in seeds[k] for direction in directions)
+    with Pool(processes) as pool:
+        results = pool.map(play_block, tasks)
+
+    per_player = len(directions) * blocks
+    units = []
+    # per block variance of a single forward block, for the baseline
+    block_variances = []
+    # variance added by the control results, per rules, as the difference
+    # of two competitors under the same rules shares one control result
+    control_weights = {}
+    start = 0
+    for (k, (_, rules)) in enumerate(competitors):
+        values = results[start:start + per_player]
+        start += per_player
+        block_variances.append(statistics.variance(values[::len(directions)]))
+        if antithetic:
+            values = _pair_means(values)
+        if controlled[k]:
+            basic = results[start:start + per_player]
+            start += per_player
+            if antithetic:
+                basic = _pair_means(basic)
+            spread = statistics.variance(basic)
+            coefficient = (statistics.covariance(values, basic) / spread
+                           if spread > 0 else 0.0)
+            (ev, std_error) = control[k]
+            values = [x - coefficient * (y - ev)
+                      for (x, y) in zip(values, basic)]
+            sign = 1 if k == 0 else -1
+            (weight, _) = control_weights.get(rules, (0.0, std_error))
+            control_weights[rules] = (weight + sign * coefficient, std_error)
+        units.append(values)
+
+    if len(units) == 2 and crn:
+        paired = [a - b for (a, b) in zip(*units)]
+        variance = statistics.variance(paired) / blocks
+    else:
+        variance = sum(statistics.variance(u) for u in units) / blocks
+    variance += sum((weight * std_error) ** 2
+                    for (weight, std_error) in control_weights.values())
+    estimate = statistics.fmean(units[0])
+    if len(units) == 2:
+        estimate -= statistics.fmean(units[1])
+
+    # independent blocks of every competitor for the same number of rounds
+    equal_cost_blocks = len(tasks) / len(competitors)
+    baseline = sum(block_variances) / equal_cost_blocks
+    return {"estimate": estimate,
+            "std_error": variance ** 0.5,
+            "baseline_std_error": baseline ** 0.5,
+            "variance_reduction": (baseline / variance if variance > 0
+                                   else float("inf")),
+            "rounds_simulated": len(tasks) * rounds}
+
+
+def parse_competitor(value: str) -> Tuple[str, str]:
+    """argparse type for strategy[:rules], rules default to the reference."""
+    (strategy, _, rules) = value.partition(":")
+    rules = rules or "reference"
+    if rules not in RULE_PRESETS:
+        raise argparse.ArgumentTypeError(
+            f"expected strategy[:rules] with rules from "
+            f"{sorted(RULE_PRESETS)}")
+    return (parse_strategy(strategy), rules)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Estimate a strategy's result, or the difference "
+                    "between two, with variance reduction")
+    parser.add_argument("competitors", type=parse_competitor, nargs="+",
+                        help="One or two strategy[:rules] to estimate")
+    parser.add_argument("-nd", "--num_decks", type=int, default=6,
+                        help="Number of decks in shoe")
+    parser.add_argument("-b", "--blocks", type=int, default=200,
+                        help="Blocks per competitor")
+    parser.add_argument("-r", "--rounds", type=int, default=500,
+                        help="Rounds per block")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for shoe streams")
+    parser.add_argument("--independent", action="store_true",
+                        help="Give each competitor its own shoes")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="Pair each shoe stream with its mirrored twin")
+    parser.add_argument("--control", action="store_true",
+                        help="Correct blocks by basic strategy's error")
+    parser.add_argument("--control_rounds", type=int, default=2000000,
+                        help="Rounds simulated for basic strategy's result")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes (defaults to all cores)")
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached basic strategy results")
+
+    args = vars(parser.parse_args())
+    competitors = args["competitors"]
+    if len(competitors) > 2:
+        print("Compare at most two competitors")
+        exit(1)
+    control = None
+    if args["control"]:
+        # basic strategy competitors are the control and are not corrected
+        control = [control_ev(rules, args["num_decks"],
+                              args["control_rounds"], args["seed"],
+                              ResultCache(args["cache_dir"]),
+                              args["processes"], counts_cards(competitors))
+                   if strategy != CONTROL_STRATEGY else None
+                   for (strategy, rules) in competitors]
+    report = compare(competitors, args["num_decks"], max(2, args["blocks"]),
+                     max(1, args["rounds"]), args["seed"],
+                     crn=not args["independent"],
+                     antithetic=args["antithetic"], control=control,
+                     processes=args["processes"])
+
+    name = " - ".join(f"{strategy}:{rules}" for (strategy, rules) in competitors)
+    print(f"{name}: {report['estimate'] * 100:+.4f}% per round "
+          f"+/- {1.96 * report['std_error'] * 100:.4f}% (95%)")
+    print(f"independent blocks, same cost: +/- "
+          f"{1.96 * report['baseline_std_error'] * 100:.4f}%")
+    print(f"variance reduction: {report['variance_reduction']:.1f}x over "
+          f"{report['rounds_simulated']} rounds")